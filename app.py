@@ -1,10 +1,10 @@
 # app.py
 import pandas as pd
-from main import process_pdf  # use your existing OCR pipeline
+from ocr_service import read_answer_key  # OCR itself runs in ocr_worker.py
 import os
 import streamlit as st
 from datetime import datetime
-from utils.prn_utils import normalize_prn
+from config import OCR_QUEUE_POLL_SECONDS
 from streamlit_cookies_manager import CookieManager
 from course_report import render_course_report
 import time
@@ -13,7 +13,7 @@ import time
 from ui_student_editor import render_students_editor
 from subject_report import render_subject_report
 from ui_students_management import render_students_management
-from modules.question_paper_llm import run_question_paper_llm_flow
+from ml_facade import run_question_paper_llm_flow  # LLM loaded on first use
 
 
 
@@ -37,7 +37,6 @@ from db_utils import (
     get_courses,
     add_subject,
     get_subjects,
-    save_exam_results,
     load_exam_results,
     update_exam_student_answers,
     update_exam_student_identity,
@@ -47,11 +46,14 @@ from db_utils import (
     load_mcq_bank_for_subject,
     import_lab_marks_from_excel,
     get_lab_marks_for_subject,
-    upsert_lab_marks,
+    bulk_upsert_lab_marks,
     get_lab_marks_map,
     publish_latest_exam_for_subject,
     unpublish_subject,
     is_subject_published,
+    enqueue_ocr_queue_job,
+    list_ocr_queue_jobs,
+    rekey_exam,
 
 )
 
@@ -241,8 +243,9 @@ def show_students_management():
 
 def run_ocr_for_subject(subject_id: int, pdf_file, key_file):
     """
-    Save uploaded files, run OCR on the PDF, compare with key,
-    and store results in session_state. One run per subject.
+    Save uploaded files, check the key, and queue the PDF for the
+    background OCR worker (ocr_worker.py). Returns the queue job id,
+    or None if the key is invalid. Does NOT wait for OCR.
     """
     #base_dir = "data/uploads"
     #os.makedirs(base_dir, exist_ok=True)
@@ -266,86 +269,98 @@ def run_ocr_for_subject(subject_id: int, pdf_file, key_file):
     with open(key_path, "wb") as f:
         f.write(key_file.getbuffer())
 
-    # Read key Excel: first row headers, then Qno & option
-    df = pd.read_excel(key_path)
-    if df.shape[1] < 2:
-        st.error("Key Excel must have at least two columns (Qno, Option).")
-        return
+    # Validate the key now, so a bad Excel fails here and not in the worker
+    try:
+        read_answer_key(key_path)
+    except ValueError as e:
+        st.error(str(e))
+        return None
+
+    return enqueue_ocr_queue_job(
+        subject_id, pdf_path, key_path, created_by=st.session_state.admin_id
+    )
+
 
-    q_col = df.columns[0]
-    a_col = df.columns[1]
-
-    key_map = {}
-    for _, row in df.iterrows():
-        q_val = row[q_col]
-        opt_val = row[a_col]
-        if pd.isna(q_val):
-            continue
-        try:
-            q_no = int(q_val)
-        except ValueError:
-            continue
-        opt_str = "" if pd.isna(opt_val) else str(opt_val).strip().upper()
-        key_map[q_no] = opt_str
-
-    # Run your OCR pipeline for THIS pdf only
-    pages = process_pdf(pdf_path)
-
-    # Build student-level structures
-    students = {}
-    total_questions = len(key_map)
-
-    for page in pages:
-        name = (page.get("name") or "").strip() or "Unknown"
-        #prn = (page.get("prn") or "").strip() or "UNKNOWN"
-        raw_prn = (page.get("prn") or "").strip()
-        prn = normalize_prn(raw_prn)
-        answers = page.get("answers", {})
-        img_path = page.get("image_path")
-
-        details = []
-        score = 0
-
-        for q_no, correct_opt in key_map.items():
-            raw_ans = answers.get(q_no, "")
-            ans_norm = "" if raw_ans is None else str(raw_ans).strip().upper()
-
-            is_blank = ans_norm == ""
-            is_correct = (not is_blank) and (ans_norm == correct_opt)
-
-            if is_correct:
-                score += 1
-
-            details.append(
-                {
-                    "question": q_no,
-                    "student_answer": ans_norm if ans_norm else "(blank)",
-                    "key_answer": correct_opt,
-                    "is_correct": is_correct,
-                    "is_blank": is_blank,
-                }
+def rekey_subject_exam(subject_id: int, exam_id: int, key_file) -> dict:
+    """
+    Re-score an existing exam with a corrected key (no OCR, no new exam).
+    """
+    base_dir = os.path.join(
+        "data",
+        "uploads",
+        f"subject_{subject_id}",
+        datetime.now().strftime("%Y%m%d_%H%M%S"),
+    )
+    os.makedirs(base_dir, exist_ok=True)
+
+    key_path = os.path.join(base_dir, f"subject_{subject_id}_key_rekey.xlsx")
+    with open(key_path, "wb") as f:
+        f.write(key_file.getbuffer())
+
+    try:
+        key_map = read_answer_key(key_path)
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
+
+    return rekey_exam(exam_id, key_map, key_path=key_path)
+
+
+def _render_ocr_queue_jobs(jobs: list):
+    for job in jobs:
+        label = f"OCR job #{job['id']}"
+        status = job["status"]
+        done = int(job.get("pages_done") or 0)
+        total = int(job.get("total_pages") or 0)
+
+        if status == "queued":
+            st.info(f"{label}: queued (waiting for OCR worker)")
+        elif status == "running":
+            st.progress(
+                done / total if total else 0.0,
+                text=f"{label}: page {done} / {total or '?'}",
             )
+        elif status == "done":
+            st.success(f"{label}: done (Exam ID: {job['exam_id']})")
+        else:
+            st.error(f"{label}: failed — {job.get('error') or 'unknown error'}")
+
 
-        if prn not in students:
-            students[prn] = []
+def _has_active_jobs(jobs: list) -> bool:
+    return any(j["status"] in ("queued", "running") for j in jobs)
 
-        students[prn].append({
-            "name": name,
-            "prn": prn,
-            "score": score,
-            "total": total_questions,
-            "details": details,
-            "image_path": img_path,
-        })
 
+def _ocr_queue_status_live(subject_id: int):
+    """Polled block: re-runs on its own while jobs are active."""
+    jobs = list_ocr_queue_jobs(subject_id, limit=5)
+    _render_ocr_queue_jobs(jobs)
+    if not _has_active_jobs(jobs):
+        # finished → rerun the whole page so results below are reloaded
+        st.rerun()
 
-    # persist everything in MySQL
-    exam_id = save_exam_results(subject_id, pdf_path, key_path, students)
 
-    # reload from DB (so structure matches what load_exam_results returns)
-    result = load_exam_results(subject_id)
-    if result is not None:
-        st.session_state.ocr_results[subject_id] = result
+if hasattr(st, "fragment"):
+    _ocr_queue_status_live = st.fragment(run_every=OCR_QUEUE_POLL_SECONDS)(_ocr_queue_status_live)
+
+
+def show_ocr_queue_status(subject_id: int):
+    jobs = list_ocr_queue_jobs(subject_id, limit=5)
+    if not jobs:
+        return
+
+    # newest finished upload replaces whatever result is cached in session
+    latest_done = next((j for j in jobs if j["status"] == "done"), None)
+    cached = st.session_state.ocr_results.get(subject_id)
+    if latest_done and cached is not None and cached.get("exam_id") != latest_done["exam_id"]:
+        st.session_state.ocr_results.pop(subject_id, None)
+
+    if _has_active_jobs(jobs) and hasattr(st, "fragment"):
+        _ocr_queue_status_live(subject_id)
+        return
+
+    _render_ocr_queue_jobs(jobs)
+    if _has_active_jobs(jobs):
+        if st.button("🔄 Refresh OCR status", key=f"ocr_refresh_{subject_id}"):
+            st.rerun()
 
 
 
@@ -581,8 +596,11 @@ def show_structure_management():
         if not pdf_file or not key_file:
             st.error("Upload both PDF and Excel key.")
         else:
-            run_ocr_for_subject(selected_subject_id, pdf_file, key_file)
-            st.success("OCR completed.")
+            job_id = run_ocr_for_subject(selected_subject_id, pdf_file, key_file)
+            if job_id:
+                st.success(f"Upload queued for OCR (job #{job_id}). You can keep working.")
+
+    show_ocr_queue_status(selected_subject_id)
 
     # ✅ Lab marks upload (independent of OCR, just used for report)
     st.markdown("---")
@@ -618,8 +636,6 @@ def show_structure_management():
     if not rows:
         st.info("No students / lab rows found yet.")
     else:
-        import pandas as pd
-
         df_lab = pd.DataFrame(rows)
 
         # Ensure columns exist
@@ -637,24 +653,34 @@ def show_structure_management():
         )
 
         with colB:
+            # result of the last save, kept across its st.rerun()
+            saved_msg = st.session_state.pop(f"lab_save_msg_{selected_subject_id}", None)
+            if saved_msg:
+                st.success(saved_msg)
+
             if st.button("💾 Save Edited Lab Marks", key=f"save_lab_{selected_subject_id}"):
-                # Update DB for each row
-                saved = 0
-                for _, r in edited.iterrows():
-                    prn = "".join(ch for ch in str(r["prn"]) if ch.isdigit()).strip()
-
-                    marks = r["marks"]
-                    ok = upsert_lab_marks(
-                        subject_id=selected_subject_id,
-                        prn=prn,
-                        marks=marks,
+                # Save ONLY rows whose marks changed (one DB round-trip)
+                before = pd.to_numeric(df_lab["marks"], errors="coerce")
+                after = pd.to_numeric(edited["marks"], errors="coerce")
+                unchanged = (before.isna() & after.isna()) | (before == after)
+                changed = edited[~unchanged.to_numpy()]
+
+                if changed.empty:
+                    st.info("No lab marks changed.")
+                else:
+                    res = bulk_upsert_lab_marks(
+                        selected_subject_id,
+                        dict(zip(changed["prn"], changed["marks"])),
                         updated_by=st.session_state.admin_id,
                     )
-                    if ok:
-                        saved += 1
-
-                st.success(f"Saved {saved} lab marks.")
-                st.rerun()
+                    if res.get("error"):
+                        st.error(f"Failed to save lab marks: {res['error']}")
+                    else:
+                        st.session_state[f"lab_save_msg_{selected_subject_id}"] = (
+                            f"Saved {res['saved']} changed lab marks "
+                            f"({len(edited) - len(changed)} unchanged, {res['skipped']} skipped)."
+                        )
+                        st.rerun()
 
 
 
@@ -766,6 +792,32 @@ def show_structure_management():
         st.write("Status:", "✅ Published" if published else "⏳ Not posted yet")
 
 
+    with st.expander("🔁 Re-score with corrected answer key"):
+        with st.form(f"rekey_form_{selected_subject_id}"):
+            rekey_file = st.file_uploader(
+                "Upload corrected answer key (Excel)",
+                type=["xlsx", "xls"],
+                key=f"rekey_{selected_subject_id}",
+            )
+            submitted_rekey = st.form_submit_button("Re-score (no OCR)")
+
+        if submitted_rekey:
+            if not rekey_file:
+                st.error("Upload the corrected Excel key.")
+            else:
+                res = rekey_subject_exam(
+                    selected_subject_id, subject_result["exam_id"], rekey_file
+                )
+                if res.get("ok"):
+                    st.session_state.ocr_results.pop(selected_subject_id, None)
+                    st.success(
+                        f"Re-scored exam {res['exam_id']} "
+                        f"({res['scores_changed']} scores changed)."
+                    )
+                    st.rerun()
+                else:
+                    st.error(res.get("error", "Re-score failed"))
+
     key_map = subject_result["answer_key"]
     students = subject_result["students"]
 
@@ -0,0 +1,430 @@
+# classifier_runtime.py
+# Answer-cell classifier backends, picked with config.OCR_BACKEND:
+#   "keras"  -> modules.answer_predictor (full TensorFlow, the .h5 model)
+#   "tflite" -> converted int8 TFLite model (tflite_runtime or tf.lite)
+#   "onnx"   -> converted ONNX model (onnxruntime)
+#
+# Convert + check against the .h5 model before switching backends:
+#   python classifier_runtime.py --convert tflite
+#   python classifier_runtime.py --parity --backend tflite
+#   python -m pytest tests/test_classifier_parity.py
+#
+# Conversion derives the output labels and input scaling from the hand
+# labels of the fixture cells (fixtures/ocr_cells/labels.csv) and stores
+# them next to the converted model (<model>.json). Parity is then checked
+# against both labels.csv and the .h5 predictions.
+import os
+import sys
+import csv
+import glob
+import json
+import shutil
+import argparse
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from config import (
+    MODEL_PATH,
+    CELLS_DIR,
+    OCR_BACKEND,
+    OCR_FIXTURES_DIR,
+    TFLITE_MODEL_PATH,
+    ONNX_MODEL_PATH,
+    OCR_PARITY_MIN_AGREEMENT,
+    OCR_FIXTURE_MIN_ACCURACY,
+)
+
+
+# ------------------------------------------------------------------
+# Input / output helpers (converted backends only; "keras" keeps
+# answer_predictor's own preprocessing)
+# ------------------------------------------------------------------
+# (scale, offset) candidates tried against answer_predictor at conversion
+_INPUT_SCALINGS = [(1.0 / 255, 0.0), (1.0, 0.0), (1.0 / 127.5, -1.0)]
+
+
+def _io_spec_path(model_path):
+    return model_path + ".json"
+
+
+def _load_io_spec(model_path):
+    """{"labels", "input_scale", "input_offset"} written by convert_model."""
+    path = _io_spec_path(model_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} missing: re-run the conversion (python classifier_runtime.py --convert ...)"
+        )
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _prepare_cells(cell_images, input_shape, scale=1.0, offset=0.0):
+    """Stack cell images into one float32 (N, H, W, C) batch for the model."""
+    _, h, w, c = input_shape
+    batch = np.empty((len(cell_images), h, w, c), dtype=np.float32)
+
+    for i, img in enumerate(cell_images):
+        if img.ndim == 3 and c == 1:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        elif img.ndim == 2 and c == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        img = cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
+        batch[i] = img.reshape(h, w, c) * scale + offset
+
+    return batch
+
+
+def _labels(probs, labels):
+    return [labels[int(i)] for i in np.argmax(probs, axis=1)]
+
+
+# ------------------------------------------------------------------
+# Backends (loaded once per process)
+# ------------------------------------------------------------------
+_predictors = {}
+
+
+def _load_tflite(model_path):
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter  # full TF fallback
+
+    spec = _load_io_spec(model_path)
+    interpreter = Interpreter(model_path=model_path)
+    inp = interpreter.get_input_details()[0]
+    out = interpreter.get_output_details()[0]
+    input_shape = tuple(inp["shape"])
+
+    def predict(cell_images):
+        x = _prepare_cells(cell_images, input_shape, spec["input_scale"], spec["input_offset"])
+
+        in_scale, in_zero = inp["quantization"]
+        if inp["dtype"] != np.float32 and in_scale:
+            x = np.round(x / in_scale + in_zero)
+            info = np.iinfo(inp["dtype"])
+            x = np.clip(x, info.min, info.max).astype(inp["dtype"])
+
+        interpreter.resize_tensor_input(inp["index"], x.shape)
+        interpreter.allocate_tensors()
+        interpreter.set_tensor(inp["index"], x)
+        interpreter.invoke()
+        y = interpreter.get_tensor(out["index"])
+
+        out_scale, out_zero = out["quantization"]
+        if out["dtype"] != np.float32 and out_scale:
+            y = (y.astype(np.float32) - out_zero) * out_scale
+        return _labels(y, spec["labels"])
+
+    return predict
+
+
+def _load_onnx(model_path):
+    import onnxruntime as ort
+
+    spec = _load_io_spec(model_path)
+    session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    inp = session.get_inputs()[0]
+    input_shape = tuple(inp.shape)
+
+    def predict(cell_images):
+        x = _prepare_cells(cell_images, input_shape, spec["input_scale"], spec["input_offset"])
+        y = session.run(None, {inp.name: x})[0]
+        return _labels(y, spec["labels"])
+
+    return predict
+
+
+def _load_keras():
+    from modules.answer_predictor import predict_cells_batch as keras_predict
+
+    def predict(cell_images):
+        predicted = keras_predict(dict(enumerate(cell_images)))
+        return [predicted.get(i) for i in range(len(cell_images))]
+
+    return predict
+
+
+def get_predictor(backend=None):
+    """Return predict(list_of_cell_images) -> list_of_labels for a backend."""
+    backend = (backend or OCR_BACKEND).lower()
+
+    if backend not in _predictors:
+        if backend == "keras":
+            _predictors[backend] = _load_keras()
+        elif backend == "tflite":
+            if not os.path.exists(TFLITE_MODEL_PATH):
+                raise FileNotFoundError(
+                    f"TFLite model not found at {TFLITE_MODEL_PATH} "
+                    "(python classifier_runtime.py --convert tflite)"
+                )
+            _predictors[backend] = _load_tflite(TFLITE_MODEL_PATH)
+        elif backend == "onnx":
+            if not os.path.exists(ONNX_MODEL_PATH):
+                raise FileNotFoundError(
+                    f"ONNX model not found at {ONNX_MODEL_PATH} "
+                    "(python classifier_runtime.py --convert onnx)"
+                )
+            _predictors[backend] = _load_onnx(ONNX_MODEL_PATH)
+        else:
+            raise ValueError(f"Unknown OCR_BACKEND: {backend!r}")
+
+    return _predictors[backend]
+
+
+def predict_cells_batch(cells, backend=None):
+    """
+    Same contract as modules.answer_predictor.predict_cells_batch:
+    {key: cell_img} -> {key: predicted option}, using the configured backend.
+    """
+    if not cells:
+        return {}
+    keys = list(cells.keys())
+    labels = get_predictor(backend)([cells[k] for k in keys])
+    return dict(zip(keys, labels))
+
+
+# ------------------------------------------------------------------
+# Fixtures, conversion + parity check (dev tools, need full TensorFlow)
+# ------------------------------------------------------------------
+FIXTURE_LABELS_FILE = "labels.csv"
+FIXTURE_UNLABELLED = "?"
+
+
+def load_fixture_cells(fixtures_dir=OCR_FIXTURES_DIR):
+    """{filename: cell_img} for every image in a fixture folder."""
+    cells = {}
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "*"))):
+        if not path.lower().endswith((".png", ".jpg", ".jpeg", ".bmp")):
+            continue
+        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if img is not None:
+            cells[os.path.basename(path)] = img
+    return cells
+
+
+def load_fixture_labels(fixtures_dir=OCR_FIXTURES_DIR):
+    """
+    {filename: true label} from <fixtures>/labels.csv ("" = blank).
+    Rows still marked "?" (added by freeze_fixtures, not labelled yet) are left out.
+    """
+    path = os.path.join(fixtures_dir, FIXTURE_LABELS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        labels = {row["file"]: row["label"].strip().upper() for row in csv.DictReader(f)}
+    return {k: v for k, v in labels.items() if v != FIXTURE_UNLABELLED}
+
+
+def freeze_fixtures(src_dir=CELLS_DIR, fixtures_dir=OCR_FIXTURES_DIR, limit=50):
+    """
+    Copy up to `limit` cells from an OCR run's scratch cells into the
+    committed fixture folder, listed in labels.csv as "?". Fill in the true
+    option (empty = blank) by looking at each cell; unlabelled rows are
+    ignored by conversion and parity.
+    """
+    cells = load_fixture_cells(src_dir)
+    if not cells:
+        raise ValueError(f"No cells in {src_dir}; run OCR on a known answer sheet first.")
+
+    os.makedirs(fixtures_dir, exist_ok=True)
+    existing = set(load_fixture_cells(fixtures_dir))
+    rows = []
+    for name in sorted(cells)[:limit]:
+        ext = os.path.splitext(name)[1].lower()
+        n = len(existing) + len(rows) + 1
+        out_name = f"scan_{n:03d}{ext}"
+        shutil.copyfile(os.path.join(src_dir, name), os.path.join(fixtures_dir, out_name))
+        rows.append((out_name, FIXTURE_UNLABELLED))
+
+    path = os.path.join(fixtures_dir, FIXTURE_LABELS_FILE)
+    is_new = not os.path.exists(path)
+    with open(path, "a", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, lineterminator="\r\n")
+        if is_new:
+            writer.writerow(["file", "label"])
+        writer.writerows(rows)
+    print(f"Added {len(rows)} cells to {fixtures_dir}: label them in {FIXTURE_LABELS_FILE}")
+    return rows
+
+
+def load_labelled_fixtures(fixtures_dir=OCR_FIXTURES_DIR):
+    """(cells, truth): {filename: cell_img} and {filename: label} for labelled cells only."""
+    cells = load_fixture_cells(fixtures_dir)
+    truth = load_fixture_labels(fixtures_dir)
+    cells = {k: v for k, v in cells.items() if k in truth}
+    if not cells:
+        raise ValueError(
+            f"No labelled fixture cells in {fixtures_dir} (see {FIXTURE_LABELS_FILE})."
+        )
+    return cells, truth
+
+
+def fixture_accuracy(predicted, truth):
+    """Share of cells whose prediction matches labels.csv (None = blank)."""
+    return sum((predicted[k] or "").strip().upper() == truth[k] for k in predicted) / len(predicted)
+
+
+def derive_io_spec(model, cells, truth):
+    """
+    Labels + input scaling for the raw .h5 model, derived from the hand
+    labels (labels.csv), not from answer_predictor, so parity against the
+    .h5 predictions stays an independent check:
+    for each candidate scaling, map every output index to the true option
+    of the fixture cells landing there, and keep the scaling that gets the
+    most cells right. Raises if that is below OCR_FIXTURE_MIN_ACCURACY or
+    if a labelled option ends up on no output.
+    """
+    names = sorted(cells)
+    raw = _prepare_cells([cells[n] for n in names], (None,) + tuple(model.input_shape[1:]))
+    n_out = int(model.output_shape[-1])
+
+    best = None
+    for scale, offset in _INPUT_SCALINGS:
+        idx = np.argmax(model.predict(raw * scale + offset, verbose=0), axis=1)
+
+        votes = [Counter() for _ in range(n_out)]
+        for name, i in zip(names, idx):
+            votes[int(i)][truth[name]] += 1
+        labels = [v.most_common(1)[0][0] if v else None for v in votes]
+
+        accuracy = sum(labels[int(i)] == truth[n] for n, i in zip(names, idx)) / len(names)
+        if best is None or accuracy > best[0]:
+            best = (accuracy, scale, offset, labels)
+
+    accuracy, scale, offset, labels = best
+    print(f"Input scaling  : x * {scale:g} + {offset:g} (accuracy {accuracy:.2%})")
+    print(f"Output labels  : {labels}")
+    if accuracy < OCR_FIXTURE_MIN_ACCURACY:
+        raise ValueError(
+            f"Raw .h5 model matches labels.csv on only {accuracy:.2%} of the fixture "
+            "cells for every known scaling; its preprocessing has changed."
+        )
+    unmapped = sorted(set(truth[n] for n in names) - set(labels))
+    if unmapped:
+        raise ValueError(f"No model output maps to labelled option(s) {unmapped}.")
+    if None in labels:
+        print("Warning: some output classes never occur in the fixtures.")
+    return {"labels": labels, "input_scale": scale, "input_offset": offset}
+
+
+def convert_model(backend, fixtures_dir=OCR_FIXTURES_DIR):
+    """
+    Convert the .h5 classifier to TFLite (int8, calibrated on the fixture
+    cells) or ONNX. Writes <model>.json with the derived labels / input
+    scaling next to it. Returns the written model path.
+    """
+    import tensorflow as tf
+
+    cells, truth = load_labelled_fixtures(fixtures_dir)
+
+    model = tf.keras.models.load_model(MODEL_PATH, compile=False)
+    input_shape = (None,) + tuple(model.input_shape[1:])
+    spec = derive_io_spec(model, cells, truth)
+
+    if backend == "tflite":
+        calib = list(cells.values())
+
+        def representative_dataset():
+            for img in calib[:500]:
+                yield [
+                    _prepare_cells(
+                        [img], (1,) + input_shape[1:], spec["input_scale"], spec["input_offset"]
+                    )
+                ]
+
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        out_path = TFLITE_MODEL_PATH
+        data = converter.convert()
+
+    elif backend == "onnx":
+        import tf2onnx
+
+        tensor_spec = (tf.TensorSpec(input_shape, tf.float32, name="input"),)
+        proto, _ = tf2onnx.convert.from_keras(model, input_signature=tensor_spec, opset=13)
+        out_path = ONNX_MODEL_PATH
+        data = proto.SerializeToString()
+
+    else:
+        raise ValueError(f"Cannot convert to backend {backend!r}")
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, "wb") as f:
+        f.write(data)
+    with open(_io_spec_path(out_path), "w", encoding="utf-8") as f:
+        json.dump(spec, f, indent=2)
+    _predictors.pop(backend, None)
+    print(f"Wrote {out_path}")
+    return out_path
+
+
+def check_parity(backend, fixtures_dir=OCR_FIXTURES_DIR):
+    """
+    Compare a converted backend with the .h5 (keras) predictions on the
+    labelled fixture cells, and both with labels.csv.
+    """
+    cells, truth = load_labelled_fixtures(fixtures_dir)
+
+    expected = predict_cells_batch(cells, backend="keras")
+    got = predict_cells_batch(cells, backend=backend)
+
+    mismatches = [(k, expected[k], got[k]) for k in cells if expected[k] != got[k]]
+    agreement = 1 - len(mismatches) / len(cells)
+
+    print(f"Cells compared : {len(cells)}")
+    print(f"Agreement      : {agreement:.2%} (min {OCR_PARITY_MIN_AGREEMENT:.2%})")
+    for name, exp, act in mismatches[:20]:
+        print(f"  {name}: keras={exp!r} {backend}={act!r}")
+
+    accuracy = {}
+    for name, pred in (("keras", expected), (backend, got)):
+        accuracy[name] = fixture_accuracy(pred, truth)
+        print(f"Accuracy {name:<6}: {accuracy[name]:.2%} (min {OCR_FIXTURE_MIN_ACCURACY:.2%})")
+
+    return {
+        "cells": len(cells),
+        "agreement": agreement,
+        "mismatches": mismatches,
+        "accuracy": accuracy,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR classifier conversion / parity check")
+    parser.add_argument("--convert", choices=["tflite", "onnx"])
+    parser.add_argument("--parity", action="store_true")
+    parser.add_argument("--backend", choices=["tflite", "onnx"], default=None)
+    parser.add_argument(
+        "--fixtures", default=OCR_FIXTURES_DIR, help="folder of labelled cell images"
+    )
+    parser.add_argument(
+        "--freeze-fixtures",
+        action="store_true",
+        help=f"copy the last OCR run's cells ({CELLS_DIR}) into --fixtures, to be labelled by hand",
+    )
+    args = parser.parse_args()
+
+    if args.freeze_fixtures:
+        freeze_fixtures(CELLS_DIR, args.fixtures)
+
+    if args.convert:
+        convert_model(args.convert, args.fixtures)
+
+    if args.parity:
+        backend = args.backend or args.convert or OCR_BACKEND
+        if backend == "keras":
+            parser.error("--parity needs a converted backend (--backend tflite|onnx)")
+        report = check_parity(backend, args.fixtures)
+        if (
+            report["agreement"] < OCR_PARITY_MIN_AGREEMENT
+            or report["accuracy"][backend] < OCR_FIXTURE_MIN_ACCURACY
+        ):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+# cohort_report.py
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+import xlsxwriter
+
+from db_utils import get_course_cohort_data, get_course_cohort_chunk
+
+COHORT_CHUNK_STUDENTS = 500
+
+ROW_COLUMNS = [
+    "prn", "name", "subject_name", "exam_uploaded", "theory_mark", "lab_mark",
+    "total", "total_possible", "percent", "status", "rank",
+    "class_avg_theory", "class_min_theory", "class_max_theory",
+]
+SUMMARY_COLUMNS = [
+    "prn", "name", "total_theory", "total_lab", "overall_total", "overall_possible",
+    "failed_subjects", "below_20_subjects", "overall_percent",
+]
+
+
+def _class_stats(score_counts: list) -> tuple[pd.DataFrame, dict]:
+    """
+    Class stats and rank tables per subject from (subject_id, score, n) counts.
+    ranks[subject_id] = (sorted distinct scores, running count of scores <= each).
+    """
+    counts = pd.DataFrame(score_counts, columns=["subject_id", "score", "n"])
+    stats = []
+    ranks = {}
+    for subject_id, g in counts.groupby("subject_id"):
+        g = g.sort_values("score")
+        vals = g["score"].to_numpy(dtype=float)
+        n = g["n"].to_numpy(dtype=float)
+        stats.append((subject_id, round(float((vals * n).sum() / n.sum()), 2), vals[0], vals[-1]))
+        ranks[subject_id] = (vals, np.concatenate([[0.0], np.cumsum(n)]))
+    stats_df = (
+        pd.DataFrame(
+            stats,
+            columns=["subject_id", "class_avg_theory", "class_min_theory", "class_max_theory"],
+        )
+        .astype({"subject_id": "int64"})
+        .set_index("subject_id")
+    )
+    return stats_df, ranks
+
+
+def _cohort_rows(
+    chunk: dict,
+    subjects: pd.DataFrame,
+    stats: pd.DataFrame,
+    ranks: dict,
+    theory_max: float,
+    lab_max: float,
+    pass_mark: float,
+):
+    """(rows_df, summary_df) for one chunk of students, in one vectorised pass."""
+    students = pd.DataFrame(chunk["students"], columns=["prn", "name"])
+    scores = pd.DataFrame(chunk["scores"], columns=["subject_id", "exam_student_id", "prn", "score"])
+    labs = pd.DataFrame(chunk["labs"], columns=["subject_id", "prn", "marks"])
+
+    scores["score"] = scores["score"].fillna(0).astype(int)
+
+    # my latest attempt per subject
+    mine = (
+        scores.sort_values("exam_student_id")
+        .drop_duplicates(["subject_id", "prn"], keep="last")[["subject_id", "prn", "score"]]
+    )
+
+    rows = students.merge(subjects, how="cross")
+    rows = rows.merge(mine, on=["subject_id", "prn"], how="left")
+    rows = rows.merge(stats, left_on="subject_id", right_index=True, how="left")
+
+    exam_uploaded = rows["exam_id"].notna()
+    theory = np.where(exam_uploaded, rows["score"].fillna(0), 0.0).astype(float)
+
+    # rank = 1 + number of class scores above mine (ties share a rank)
+    rank = np.full(len(rows), np.nan)
+    for subject_id, (vals, at_or_below) in ranks.items():
+        idx = np.flatnonzero((rows["subject_id"] == subject_id).to_numpy() & exam_uploaded.to_numpy())
+        k = np.searchsorted(vals, theory[idx], side="right")
+        rank[idx] = at_or_below[-1] - at_or_below[k] + 1
+
+    # lab: NA (no lab rows for subject) / AB (mine missing or NULL) / marks
+    lab_applicable = rows["has_lab"].fillna(0).astype(bool).to_numpy()
+    my_lab = labs.drop_duplicates(["subject_id", "prn"]).rename(columns={"marks": "lab_marks"})
+    rows = rows.merge(my_lab, on=["subject_id", "prn"], how="left")
+    lab_numeric = pd.to_numeric(rows["lab_marks"], errors="coerce").to_numpy(dtype=float)
+    lab_absent = lab_applicable & np.isnan(lab_numeric)
+    lab_value = np.where(lab_applicable & ~lab_absent, lab_numeric, 0.0)
+
+    total_possible = theory_max + np.where(lab_applicable, lab_max, 0.0)
+    total = theory + lab_value
+    percent = np.round(np.where(total_possible > 0, total / total_possible * 100.0, 0.0), 2)
+
+    status = np.select(
+        [
+            ~exam_uploaded.to_numpy(),
+            theory < pass_mark,
+            ~lab_applicable,
+            lab_absent,
+            lab_value < pass_mark,
+        ],
+        ["NO EXAM", "FAIL", "PASS", "ABSENT", "FAIL"],
+        default="PASS",
+    )
+
+    lab_display = np.where(
+        ~lab_applicable, "NA", np.where(lab_absent, "AB", np.round(lab_value, 2).astype(object))
+    )
+
+    up = exam_uploaded.to_numpy()
+    out = pd.DataFrame(
+        {
+            "prn": rows["prn"],
+            "name": rows["name"],
+            "subject_name": rows["subject_name"],
+            "exam_uploaded": np.where(up, "Yes", "No"),
+            "theory_mark": np.where(up, theory, np.nan),
+            "lab_mark": lab_display,
+            "total": np.where(up, np.round(total, 2), np.nan),
+            "total_possible": np.where(up, total_possible, np.nan),
+            "percent": np.where(up, percent, np.nan),
+            "status": status,
+            "rank": rank,
+            "class_avg_theory": rows["class_avg_theory"].fillna(0.0),
+            "class_min_theory": rows["class_min_theory"].fillna(0).astype(int),
+            "class_max_theory": rows["class_max_theory"].fillna(0).astype(int),
+        }
+    )
+    out["rank"] = out["rank"].astype("Int64")
+
+    # per-student summary (only subjects with an exam count towards totals)
+    agg = pd.DataFrame(
+        {
+            "prn": rows["prn"],
+            "name": rows["name"],
+            "theory": theory,
+            "lab": np.where(up, lab_value, 0.0),
+            "total": np.where(up, total, 0.0),
+            "possible": np.where(up, total_possible, 0.0),
+            "failed": np.where(status == "FAIL", rows["subject_name"], None),
+            "below_20": np.where(up & (total < 20), rows["subject_name"], None),
+        }
+    )
+    summary = agg.groupby(["prn", "name"], sort=False).agg(
+        total_theory=("theory", "sum"),
+        total_lab=("lab", "sum"),
+        overall_total=("total", "sum"),
+        overall_possible=("possible", "sum"),
+        failed_subjects=("failed", lambda s: ", ".join(s.dropna())),
+        below_20_subjects=("below_20", lambda s: ", ".join(s.dropna())),
+    ).reset_index()
+    possible = summary["overall_possible"].where(summary["overall_possible"] > 0)
+    summary["overall_percent"] = (summary["overall_total"] / possible * 100.0).fillna(0.0).round(2)
+    for col in ["total_theory", "total_lab", "overall_total", "overall_possible"]:
+        summary[col] = summary[col].round(2)
+
+    return out[ROW_COLUMNS], summary[SUMMARY_COLUMNS]
+
+
+def iter_cohort_report(
+    course_id: int,
+    theory_max: float = 40.0,
+    lab_max: float = 40.0,
+    pass_mark: float = 16.0,
+    chunk_size: int = COHORT_CHUNK_STUDENTS,
+):
+    """
+    Every student's student-wise report for a course, `chunk_size` students at a
+    time (same rules as db_utils.get_student_wise_report).
+    Class stats / ranks are computed once per subject from score counts, so
+    memory depends on the chunk size, not on the course size.
+
+    Yields (rows_df, summary_df) per chunk:
+      rows_df    -> one row per (student, subject)
+      summary_df -> one row per student
+    """
+    data = get_course_cohort_data(course_id)
+    subjects = pd.DataFrame(
+        data["subjects"], columns=["subject_id", "subject_name", "exam_id", "has_lab"]
+    )
+    if subjects.empty:
+        return
+    stats, ranks = _class_stats(data["score_counts"])
+
+    after_prn = ""
+    while True:
+        chunk = get_course_cohort_chunk(course_id, after_prn, chunk_size)
+        if not chunk["students"]:
+            return
+        yield _cohort_rows(chunk, subjects, stats, ranks, theory_max, lab_max, pass_mark)
+        if len(chunk["students"]) < chunk_size:
+            return
+        after_prn = chunk["students"][-1]["prn"]
+
+
+def _cells(df: pd.DataFrame) -> list:
+    """Rows as plain Python lists; NaN / NA become None (blank cell)."""
+    return df.astype(object).where(df.notna(), None).values.tolist()
+
+
+def write_cohort_excel(chunks, fh) -> tuple[int, int]:
+    """
+    Multi-sheet Excel: Summary, Subject Rows, Theory (PRN x Subject), written to
+    `fh` one chunk at a time. Every sheet is filled strictly in row order with
+    write_row under constant_memory, so xlsxwriter flushes each row to its
+    temp file instead of holding the sheets in memory.
+
+    Returns (students, subjects) written.
+    """
+    wb = xlsxwriter.Workbook(fh, {"constant_memory": True})
+    ws_summary = wb.add_worksheet("Summary")
+    ws_rows = wb.add_worksheet("Subject Rows")
+    ws_theory = wb.add_worksheet("Theory")
+
+    ws_summary.write_row(0, 0, SUMMARY_COLUMNS)
+    ws_rows.write_row(0, 0, ROW_COLUMNS)
+
+    subject_names = None
+    n_subjects = 0
+    r_summary = r_rows = r_theory = 1
+    for rows_df, summary_df in chunks:
+        if subject_names is None:
+            n_subjects = rows_df["subject_name"].nunique()
+            # every student carries every subject, in subject order;
+            # subjects without an exam have no theory column
+            uploaded = rows_df["exam_uploaded"] == "Yes"
+            subject_names = list(dict.fromkeys(rows_df.loc[uploaded, "subject_name"]))
+            ws_theory.write_row(0, 0, ["prn", "name"] + subject_names)
+
+        for row in _cells(summary_df):
+            ws_summary.write_row(r_summary, 0, row)
+            r_summary += 1
+
+        for row in _cells(rows_df):
+            ws_rows.write_row(r_rows, 0, row)
+            r_rows += 1
+
+        theory = (
+            rows_df.groupby(["prn", "name", "subject_name"], sort=False)["theory_mark"]
+            .mean()
+            .unstack("subject_name")
+            .reindex(columns=subject_names)
+            .reset_index()
+        )
+        for row in _cells(theory):
+            ws_theory.write_row(r_theory, 0, row)
+            r_theory += 1
+
+    wb.close()
+    return r_summary - 1, n_subjects
+
+
+def write_cohort_zip(chunks, fh) -> tuple[int, int]:
+    """
+    ZIP with one CSV per student (<PRN>_student_report.csv), written to `fh`
+    as each chunk is built.
+
+    Returns (students, subjects) written.
+    """
+    students = subjects = 0
+    with zipfile.ZipFile(fh, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for rows_df, summary_df in chunks:
+            subjects = rows_df["subject_name"].nunique()
+            for prn, df_student in rows_df.groupby("prn", sort=False):
+                zf.writestr(
+                    f"{prn}_student_report.csv",
+                    df_student.drop(columns=["prn", "name"]).to_csv(index=False),
+                )
+                students += 1
+    return students, subjects
+
+
+def render_cohort_export(
+    *,
+    course_id: int,
+    course_name: str,
+    theory_max: float = 40.0,
+    lab_max: float = 40.0,
+    pass_mark: float = 16.0,
+):
+    fmt = st.radio(
+        "Format",
+        ["Excel (all sheets)", "ZIP (one CSV per student)"],
+        horizontal=True,
+        key=f"cohort_fmt_{course_id}",
+    )
+
+    if st.button("Export All Student Reports", key=f"btn_cohort_export_{course_id}"):
+        chunks = iter_cohort_report(
+            course_id, theory_max=theory_max, lab_max=lab_max, pass_mark=pass_mark
+        )
+        # unbuffered temp file: the export goes to disk, and download_button
+        # accepts a raw file object
+        out = tempfile.TemporaryFile(buffering=0)
+        with st.spinner("Building cohort report..."):
+            if fmt.startswith("Excel"):
+                n_students, n_subjects = write_cohort_excel(chunks, out)
+            else:
+                n_students, n_subjects = write_cohort_zip(chunks, out)
+
+        if not n_students:
+            out.close()
+            st.info("No students / subjects found for this course.")
+            return
+
+        out.seek(0)
+        safe_name = "".join(ch if ch.isalnum() else "_" for ch in course_name)
+        if fmt.startswith("Excel"):
+            st.download_button(
+                "Download Cohort Report Excel",
+                data=out,
+                file_name=f"{safe_name}_student_reports.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key=f"dl_cohort_xlsx_{course_id}",
+            )
+        else:
+            st.download_button(
+                "Download Cohort Report ZIP",
+                data=out,
+                file_name=f"{safe_name}_student_reports.zip",
+                mime="application/zip",
+                key=f"dl_cohort_zip_{course_id}",
+            )
+        st.caption(f"{n_students} students × {n_subjects} subjects")
@@ -14,6 +14,19 @@ PREPROCESSED_DIR = os.path.join(TEMP_DIR, "preprocessed")
 CELLS_DIR = os.path.join(TEMP_DIR, "cells")
 
 MODEL_PATH = os.path.join(BASE_DIR, "models", "ocr_classifier_final.h5")
+
+# Answer classifier backend (classifier_runtime.py):
+#   "keras"  -> MODEL_PATH through full TensorFlow
+#   "tflite" -> TFLITE_MODEL_PATH (int8, needs tflite-runtime or tensorflow)
+#   "onnx"   -> ONNX_MODEL_PATH (needs onnxruntime)
+# Convert + run the parity check before switching away from "keras".
+OCR_BACKEND = os.getenv("OCR_BACKEND", "keras")
+TFLITE_MODEL_PATH = os.path.join(BASE_DIR, "models", "ocr_classifier_int8.tflite")
+ONNX_MODEL_PATH = os.path.join(BASE_DIR, "models", "ocr_classifier.onnx")
+# hand-labelled cells (labels.csv) for conversion / parity (CELLS_DIR is per-run scratch)
+OCR_FIXTURES_DIR = os.path.join(BASE_DIR, "fixtures", "ocr_cells")
+OCR_PARITY_MIN_AGREEMENT = 0.995   # converted backend vs .h5 predictions
+OCR_FIXTURE_MIN_ACCURACY = 0.95    # any backend vs labels.csv
 # config.py
 
 LLM_MODEL_PATH = r"D:\\llm_check\\granite-3.3-2b-instruct-Q3_K_L.gguf"
@@ -24,6 +37,35 @@ TABLE_ROWS = 8
 TABLE_COLS = 5
 CELL_MARGIN = 10
 
+# Parallel OCR (process pool, one classifier per worker)
+OCR_PARALLEL = False
+OCR_WORKERS = os.cpu_count() or 1
+
+# Pages whose cells (TABLE_ROWS x TABLE_COLS each) go to the model in one call
+PREDICT_BATCH_PAGES = 16
+
+# Page rasterisation:
+#   "full" -> whole page at PDF_DPI
+#   "roi"  -> low-DPI overview to find the header + answer table, then only
+#             those clip rectangles at PDF_DPI (check with: main.py --compare-roi)
+RASTER_MODE = "full"
+ROI_OVERVIEW_DPI = 100   # also used as the UI page image in "roi" mode
+ROI_PADDING_PT = 12      # padding around located regions, in PDF points
+
+# OCR result caches: the page cache (keyed by pixel hash) and the whole-PDF
+# job checkpoints (ocr_jobs). Bump after retraining / changing the classifier
+# or preprocessing so old cached answers are not reused.
+OCR_CACHE_TAG = "v1"
+# What produced a cached result: tag, classifier backend and raster mode.
+# Part of the page-cache key and stored on ocr_jobs; a mismatch is a miss.
+OCR_RESULT_CONFIG = f"{OCR_CACHE_TAG}:{OCR_BACKEND}:{RASTER_MODE}"
+
+# Background OCR queue (ocr_worker.py)
+OCR_QUEUE_CONCURRENCY = 1      # uploads processed at the same time
+OCR_QUEUE_POLL_SECONDS = 2
+OCR_QUEUE_LEASE_SECONDS = 120  # worker lease; a job whose lease expires is reclaimed
+OCR_QUEUE_HEARTBEAT_SECONDS = 30  # lease renewal interval (well under the lease)
+
 # Create directories
 for directory in [INPUT_DIR, TEMP_DIR, OUTPUT_DIR, IMAGES_DIR, PREPROCESSED_DIR, CELLS_DIR]:
     os.makedirs(directory, exist_ok=True)
@@ -0,0 +1,357 @@
+# db_bench.py
+# Synthetic-data regression benchmarks for the exam result paths, on an
+# in-memory SQLite database (no MySQL server needed). Each benchmark runs
+# the current db_utils SQL next to the per-student path it replaced and
+# checks both give the same result.
+#
+# In-process SQLite has no network, so the time a MySQL server would add
+# per statement is reported separately as statements x --rtt-ms.
+#
+#   python db_bench.py load --students 3000 --rtt-ms 0.5
+#   python db_bench.py save --students 3000 --rtt-ms 0.5
+import sys
+import time
+import random
+import sqlite3
+import argparse
+
+from db_utils import _EXAM_RESULTS_SQL, _group_exam_result_rows, _insert_exam_results
+
+
+QUESTIONS = 40
+OPTIONS = "ABCD"
+
+_SCHEMA = """
+CREATE TABLE exams (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject_id INTEGER NOT NULL,
+    pdf_path TEXT,
+    key_path TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE exam_students (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    exam_id INTEGER NOT NULL,
+    prn TEXT,
+    name TEXT,
+    score INTEGER NOT NULL DEFAULT 0,
+    total_questions INTEGER NOT NULL DEFAULT 0,
+    image_path TEXT,
+    is_conflict INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX idx_es_exam_prn ON exam_students (exam_id, prn);
+CREATE TABLE exam_answers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    exam_student_id INTEGER NOT NULL,
+    question_no INTEGER NOT NULL,
+    student_answer TEXT,
+    key_answer TEXT,
+    is_correct INTEGER NOT NULL,
+    is_blank INTEGER NOT NULL,
+    UNIQUE (exam_student_id, question_no)
+);
+"""
+
+
+class _Cursor:
+    """sqlite3 cursor taking db_utils' %s placeholders; counts statements."""
+
+    def __init__(self, conn):
+        self._cur = conn.cursor()
+        self.statements = 0
+
+    def execute(self, sql, params=()):
+        self.statements += 1
+        return self._cur.execute(sql.replace("%s", "?"), params)
+
+    def executemany(self, sql, rows):
+        self.statements += 1
+        return self._cur.executemany(sql.replace("%s", "?"), rows)
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+
+def _connect():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def synthetic_students(n_students, seed=0):
+    """{prn: [attempt]} shaped like the OCR output save_exam_results takes."""
+    rng = random.Random(seed)
+    key = [rng.choice(OPTIONS) for _ in range(QUESTIONS)]
+    students = {}
+    for i in range(n_students):
+        details = []
+        for q, k in enumerate(key, start=1):
+            ans = rng.choice(OPTIONS + " ").strip()
+            details.append(
+                {
+                    "question": q,
+                    "student_answer": ans or "(blank)",
+                    "key_answer": k,
+                    "is_correct": ans == k,
+                    "is_blank": not ans,
+                }
+            )
+        prn = f"{2400000000 + i}"
+        students[prn] = [
+            {
+                "name": f"Student {i}",
+                "score": sum(d["is_correct"] for d in details),
+                "total": QUESTIONS,
+                "image_path": f"{prn}.jpg",
+                "details": details,
+            }
+        ]
+    return students
+
+
+def _seed_exam(conn, students):
+    """Bulk-load one exam with its attempts + answers; returns exam_id."""
+    cur = conn.cursor()
+    cur.execute("INSERT INTO exams (subject_id, pdf_path, key_path) VALUES (1, 'x.pdf', 'k.xlsx')")
+    exam_id = cur.lastrowid
+    for prn, entries in students.items():
+        for entry in entries:
+            cur.execute(
+                """
+                INSERT INTO exam_students (exam_id, prn, name, score, total_questions, image_path)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (exam_id, prn, entry["name"], entry["score"], entry["total"], entry["image_path"]),
+            )
+            es_id = cur.lastrowid
+            cur.executemany(
+                """
+                INSERT INTO exam_answers
+                    (exam_student_id, question_no, student_answer, key_answer, is_correct, is_blank)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        es_id,
+                        d["question"],
+                        None if d["student_answer"] == "(blank)" else d["student_answer"],
+                        d["key_answer"],
+                        int(d["is_correct"]),
+                        int(d["is_blank"]),
+                    )
+                    for d in entry["details"]
+                ],
+            )
+    conn.commit()
+    return exam_id
+
+
+# ------------------------------------------------------------------
+# load_exam_results
+# ------------------------------------------------------------------
+def _load_per_student(cur, exam_id):
+    """The old load_exam_results body: 1 query for students + 1 per student."""
+    cur.execute(
+        """
+        SELECT id, prn, name, score, total_questions, image_path
+        FROM exam_students
+        WHERE exam_id = %s
+        """,
+        (exam_id,),
+    )
+    key_map = {}
+    students = {}
+    for exam_student_id, prn, name, score, total, image_path in cur.fetchall():
+        cur.execute(
+            """
+            SELECT question_no, student_answer, key_answer, is_correct, is_blank
+            FROM exam_answers
+            WHERE exam_student_id = %s
+            ORDER BY question_no
+            """,
+            (exam_student_id,),
+        )
+        details = []
+        for q_no, s_ans, k_ans, is_corr, is_blank in cur.fetchall():
+            k_ans = (k_ans or "").strip().upper()
+            if q_no not in key_map:
+                key_map[q_no] = k_ans
+            details.append(
+                {
+                    "question": int(q_no),
+                    "student_answer": s_ans if s_ans else "(blank)",
+                    "key_answer": k_ans,
+                    "is_correct": bool(is_corr),
+                    "is_blank": bool(is_blank),
+                }
+            )
+        students.setdefault(prn, []).append(
+            {
+                "exam_student_id": exam_student_id,
+                "name": name,
+                "prn": prn,
+                "score": int(score),
+                "total": int(total),
+                "image_path": image_path,
+                "details": details,
+            }
+        )
+    return key_map, students
+
+
+def _load_joined(cur, exam_id):
+    """The current load_exam_results body (same SQL + grouping)."""
+    cur.execute(_EXAM_RESULTS_SQL, (exam_id,))
+    return _group_exam_result_rows(cur.fetchall())
+
+
+def _timed(fn, conn, exam_id, repeat):
+    best = None
+    for _ in range(repeat):
+        cur = _Cursor(conn)
+        t = time.perf_counter()
+        result = fn(cur, exam_id)
+        dt = time.perf_counter() - t
+        best = dt if best is None else min(best, dt)
+    return best, cur.statements, result
+
+
+def _report(label, seconds, statements, rtt_ms):
+    print(
+        f"  {label:<12}: {seconds * 1000:9.1f} ms local  {statements:6d} statements"
+        f"  -> {seconds * 1000 + statements * rtt_ms:9.1f} ms at {rtt_ms:g} ms RTT"
+    )
+
+
+def bench_load(n_students=3000, repeat=3, rtt_ms=0.5):
+    """Per-student answer queries vs the single joined query."""
+    conn = _connect()
+    exam_id = _seed_exam(conn, synthetic_students(n_students))
+
+    old_t, old_n, old = _timed(_load_per_student, conn, exam_id, repeat)
+    new_t, new_n, new = _timed(_load_joined, conn, exam_id, repeat)
+    same = old == new
+
+    print(f"load_exam_results, {n_students} students x {QUESTIONS} answers (best of {repeat})")
+    _report("per-student", old_t, old_n, rtt_ms)
+    _report("joined", new_t, new_n, rtt_ms)
+    print(f"  same result : {same}")
+    return same
+
+
+# ------------------------------------------------------------------
+# save_exam_results
+# ------------------------------------------------------------------
+def _save_per_student(conn, cur, students):
+    """
+    The old save_exam_results body: one INSERT per attempt + one answers
+    executemany per attempt, each committed on its own (autocommit).
+    """
+    cur.execute(
+        "INSERT INTO exams (subject_id, pdf_path, key_path) VALUES (%s, %s, %s)",
+        (1, "x.pdf", "k.xlsx"),
+    )
+    conn.commit()
+    exam_id = cur.lastrowid
+
+    for prn, entries in students.items():
+        is_conflict = 1 if len(entries) > 1 else 0
+        for entry in entries:
+            cur.execute(
+                """
+                INSERT INTO exam_students
+                    (exam_id, prn, name, score, total_questions, image_path, is_conflict)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """,
+                (
+                    exam_id,
+                    prn,
+                    entry.get("name", "Unknown"),
+                    int(entry.get("score", 0)),
+                    int(entry.get("total", 0)),
+                    entry.get("image_path"),
+                    is_conflict,
+                ),
+            )
+            conn.commit()
+            exam_student_id = cur.lastrowid
+
+            answer_rows = [
+                (
+                    exam_student_id,
+                    int(d["question"]),
+                    None if d["student_answer"] == "(blank)" else d["student_answer"],
+                    d["key_answer"],
+                    int(d["is_correct"]),
+                    int(d["is_blank"]),
+                )
+                for d in entry.get("details", [])
+            ]
+            if answer_rows:
+                cur.executemany(
+                    """
+                    INSERT INTO exam_answers
+                        (exam_student_id, question_no, student_answer,
+                         key_answer, is_correct, is_blank)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    """,
+                    answer_rows,
+                )
+                conn.commit()
+    return exam_id
+
+
+def _save_bulk(conn, cur, students):
+    """The current save_exam_results body: one transaction, chunked bulk inserts."""
+    exam_id = _insert_exam_results(cur, 1, "x.pdf", "k.xlsx", students)
+    conn.commit()
+    return exam_id
+
+
+def bench_save(n_students=3000, repeat=3, rtt_ms=0.5):
+    """Per-attempt inserts + commits vs one transaction of bulk inserts."""
+    students = synthetic_students(n_students)
+
+    results = {}
+    for label, fn in (("per-student", _save_per_student), ("bulk", _save_bulk)):
+        best = None
+        for _ in range(repeat):
+            conn = _connect()  # fresh database per run
+            cur = _Cursor(conn)
+            t = time.perf_counter()
+            exam_id = fn(conn, cur, students)
+            dt = time.perf_counter() - t
+            best = dt if best is None else min(best, dt)
+        # what was written, read back the same way load_exam_results does
+        results[label] = (best, cur.statements, _load_joined(_Cursor(conn), exam_id))
+
+    print(f"save_exam_results, {n_students} students x {QUESTIONS} answers (best of {repeat})")
+    for label, (seconds, statements, _) in results.items():
+        _report(label, seconds, statements, rtt_ms)
+    same = results["per-student"][2] == results["bulk"][2]
+    print(f"  same rows   : {same}")
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exam result path benchmarks (SQLite)")
+    parser.add_argument("bench", choices=["load", "save"])
+    parser.add_argument("--students", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--rtt-ms", type=float, default=0.5, help="MySQL round trip per statement")
+    args = parser.parse_args()
+
+    bench = bench_load if args.bench == "load" else bench_save
+    ok = bench(args.students, args.repeat, args.rtt_ms)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
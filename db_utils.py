@@ -2,23 +2,124 @@
 import pandas as pd
 
 import os
+import sys
+import json
+import time
 import hashlib
+import threading
+from contextlib import contextmanager
+
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
+from mysql.connector.errors import PoolError
 
 
 # ------------------------------------------------------------------
-# Connection
+# Connection (process-wide pool)
 # ------------------------------------------------------------------
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))  # mysql.connector max is 32
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _connection_params() -> dict:
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "user": os.getenv("DB_USER", "omr_user"),
+        "password": os.getenv("DB_PASSWORD", "omr_user@123"),
+        "database": os.getenv("DB_NAME", "omr_portal"),
+        "autocommit": True,
+    }
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name=f"omr_pool_{os.getpid()}",
+                    pool_size=max(1, min(DB_POOL_SIZE, 32)),
+                    pool_reset_session=True,
+                    **_connection_params(),
+                )
+    return _pool
+
+
 def get_connection():
-    """Return a new DB connection."""
-    return mysql.connector.connect(
-        host=os.getenv("DB_HOST", "localhost"),
-        user=os.getenv("DB_USER", "omr_user"),
-        password=os.getenv("DB_PASSWORD", "omr_user@123"),
-        database=os.getenv("DB_NAME", "omr_portal"),
-        autocommit=True,
-    )
+    """
+    Borrow a DB connection from the process-wide pool.
+    conn.close() hands it back (session reset, open transaction rolled
+    back); autocommit comes from the pool config and is re-applied by
+    that reset and by a ping reconnect. If the pool is exhausted, a plain one-off connection is
+    returned instead, so callers never block.
+    """
+    try:
+        conn = _get_pool().get_connection()
+    except PoolError:
+        return mysql.connector.connect(**_connection_params())
+
+    try:
+        # health check: revive connections dropped by wait_timeout / restarts
+        conn.ping(reconnect=True, attempts=2, delay=0)
+    except Error:
+        try:
+            conn.close()
+        except Error:
+            pass
+        return mysql.connector.connect(**_connection_params())
+    return conn
+
+
+@contextmanager
+def db_connection():
+    """with db_connection() as conn: ...  (always returned to the pool)"""
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def _advisory_lock(conn, name: str, timeout: int):
+    """
+    MySQL named lock (GET_LOCK) held on conn for the with-block.
+    Yields True if acquired, False on timeout.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT GET_LOCK(%s, %s)", (name, int(timeout)))
+    row = cur.fetchone()
+    locked = bool(row and row[0] == 1)
+    try:
+        yield locked
+    finally:
+        if locked:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (name,))
+            cur.fetchall()
+
+
+def bench_connections(n: int = 50) -> dict:
+    """Average seconds per fresh connect vs pooled borrow (+ one SELECT 1 each)."""
+    def _timed(open_conn):
+        t = time.perf_counter()
+        for _ in range(n):
+            conn = open_conn()
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.fetchall()
+            finally:
+                conn.close()
+        return (time.perf_counter() - t) / n
+
+    _get_pool()  # pool creation is a one-off cost, keep it out of the numbers
+    direct = _timed(lambda: mysql.connector.connect(**_connection_params()))
+    pooled = _timed(get_connection)
+    print(f"direct connect : {direct * 1000:.2f} ms/query")
+    print(f"pooled borrow  : {pooled * 1000:.2f} ms/query")
+    return {"direct": direct, "pooled": pooled}
 
 
 
@@ -54,32 +155,21 @@ def get_students_for_exam_with_emails(*, exam_id: int, subject_id: int):
                 s.name AS student_name,
                 s.email,
                 es.score,
-                es.total_questions
+                es.total_questions,
+                lm.marks AS lab_marks
             FROM exam_students es
             LEFT JOIN students s
-              ON TRIM(es.prn) = TRIM(s.prn)
+              ON s.prn = es.prn
+            LEFT JOIN lab_marks lm
+              ON lm.subject_id = %s AND lm.prn = es.prn
             WHERE es.exam_id = %s
             """,
-            (exam_id,),
+            (subject_id, exam_id),
         )
         rows = cur.fetchall() or []
 
-        # add lab marks for each student (if any)
         for r in rows:
-            prn = (r.get("prn") or "").strip()
-
-            cur2 = conn.cursor(dictionary=True)
-            cur2.execute(
-                """
-                SELECT marks
-                FROM lab_marks
-                WHERE subject_id=%s AND prn=%s
-                LIMIT 1
-                """,
-                (subject_id, prn),
-            )
-            lm = cur2.fetchone()
-            r["lab_marks"] = float(lm["marks"]) if lm and lm["marks"] is not None else None
+            r["lab_marks"] = float(r["lab_marks"]) if r["lab_marks"] is not None else None
 
         return rows
     finally:
@@ -91,19 +181,218 @@ def get_students_for_exam_with_emails(*, exam_id: int, subject_id: int):
 def _hash_password(raw_password: str) -> str:
     return hashlib.sha256(raw_password.encode("utf-8")).hexdigest()
 
-def _safe_execute(cur, stmt: str):
+# ------------------------------------------------------------------
+# Schema migrations (versioned, applied once, recorded in schema_migrations)
+# Steps: (table, index_name, "col, col")  -> CREATE INDEX if missing
+#        "SQL ..."                        -> executed as-is
+#        callable                         -> called with the cursor
+# Append new versions at the end; never edit an applied one.
+# ------------------------------------------------------------------
+def _add_column(table: str, column: str, definition: str):
+    """Migration step: ALTER TABLE ... ADD COLUMN unless it already exists."""
+    def step(cur):
+        if not _column_exists(cur, table, column):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+def _check_prn_collisions(cur):
+    """
+    Migration step: refuse to normalise stored PRNs while two rows would end
+    up on the same digits-only PRN (students.prn, lab_marks (subject_id, prn)).
+    Lists every collision so they can be merged by hand first.
+    """
+    checks = [
+        ("students", "", "prn"),
+        ("lab_marks", "subject_id, ", "subject_id, prn"),
+    ]
+    found = []
+    for table, group_cols, label_cols in checks:
+        cur.execute(
+            f"""
+            SELECT {group_cols}REGEXP_REPLACE(prn, '[^0-9]', '') AS norm,
+                   GROUP_CONCAT(CONCAT('"', prn, '"') ORDER BY prn SEPARATOR ', ')
+            FROM {table}
+            WHERE REGEXP_REPLACE(prn, '[^0-9]', '') <> ''
+            GROUP BY {group_cols}norm
+            HAVING COUNT(*) > 1
+            ORDER BY {group_cols}norm
+            """
+        )
+        for row in cur.fetchall():
+            key = ", ".join(str(v) for v in row[:-1])
+            found.append(f"{table} ({label_cols} = {key}): {row[-1]}")
+
+    if found:
+        shown = "\n  ".join(found[:50])
+        more = f"\n  ... and {len(found) - 50} more" if len(found) > 50 else ""
+        raise RuntimeError(
+            "Cannot normalise PRNs: these rows would collide on the same digits-only "
+            f"PRN. Merge or fix them, then restart.\n  {shown}{more}"
+        )
+
+
+MIGRATIONS = [
+    (1, "baseline indexes (previously created ad hoc by init_db)", [
+        ("students", "idx_students_course_last3", "course_id, prn_last3"),
+        ("students", "idx_students_batch_course_last3", "batch_id, course_id, prn_last3"),
+        ("question_papers", "idx_qp_subject_created", "subject_id, created_at"),
+        ("mcq_bank", "idx_mcq_qp_qno", "question_paper_id, question_no"),
+    ]),
+    (2, "hot lookup indexes", [
+        ("exam_students", "idx_es_exam_prn", "exam_id, prn"),
+        ("exams", "idx_exams_subject_created", "subject_id, created_at"),
+        ("subject_publish", "idx_sp_published", "is_published"),
+        ("students", "idx_students_course_prn", "course_id, prn"),
+    ]),
+    (3, "normalise stored PRNs (plain equality joins, no TRIM)", [
+        # students / lab_marks: digits only (_normalize_prn); aborts with the
+        # list of PRNs that would collide instead of skipping them
+        _check_prn_collisions,
+        """
+        UPDATE students
+        SET prn = REGEXP_REPLACE(prn, '[^0-9]', '')
+        WHERE prn REGEXP '[^0-9]' AND REGEXP_REPLACE(prn, '[^0-9]', '') <> ''
+        """,
+        """
+        UPDATE lab_marks
+        SET prn = REGEXP_REPLACE(prn, '[^0-9]', '')
+        WHERE prn REGEXP '[^0-9]' AND REGEXP_REPLACE(prn, '[^0-9]', '') <> ''
+        """,
+        # exam_students: _normalize_exam_prn (digits, else trimmed text)
+        """
+        UPDATE exam_students
+        SET prn = CASE
+            WHEN REGEXP_REPLACE(prn, '[^0-9]', '') <> '' THEN REGEXP_REPLACE(prn, '[^0-9]', '')
+            ELSE TRIM(prn)
+        END
+        WHERE prn REGEXP '[^0-9]'
+        """,
+        # derived per-exam data keyed by PRN
+        "DELETE FROM exam_rank_summary",
+        "DELETE FROM published_snapshot_state",
+    ]),
+    (4, "ocr_queue worker leases", [
+        _add_column("ocr_queue", "worker_id", "VARCHAR(64) NULL AFTER claim_token"),
+        _add_column("ocr_queue", "lease_expires_at", "DATETIME NULL AFTER worker_id"),
+        ("ocr_queue", "idx_ocr_queue_lease", "status, lease_expires_at"),
+        # jobs already running keep the old 30 min no-progress window
+        """
+        UPDATE ocr_queue
+        SET lease_expires_at = updated_at + INTERVAL 30 MINUTE
+        WHERE status = 'running' AND lease_expires_at IS NULL
+        """,
+    ]),
+    (5, "ocr_jobs remember the OCR config that produced them", [
+        # existing jobs stay NULL: unknown config, so they are re-OCR'd once
+        _add_column("ocr_jobs", "ocr_config", "VARCHAR(64) NULL AFTER pdf_path"),
+    ]),
+]
+
+def _index_exists(cur, table: str, index_name: str) -> bool:
+    cur.execute(
+        """
+        SELECT 1
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+        """,
+        (table, index_name),
+    )
+    return cur.fetchone() is not None
+
+
+def _column_exists(cur, table: str, column: str) -> bool:
+    cur.execute(
+        """
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        LIMIT 1
+        """,
+        (table, column),
+    )
+    return cur.fetchone() is not None
+
+
+def run_migrations(conn) -> list[int]:
+    """Apply pending MIGRATIONS in order. Returns the versions applied."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+    # admin portal, student portal and OCR workers may all start at once
+    with _advisory_lock(conn, "omr_schema_migrations", 60) as locked:
+        if not locked:
+            raise RuntimeError(
+                "Timed out waiting for the schema migration lock "
+                "(another process is still migrating); not applying migrations."
+            )
+        cur.execute("SELECT version FROM schema_migrations")
+        applied = {int(r[0]) for r in cur.fetchall()}
+
+        done = []
+        for version, name, steps in MIGRATIONS:
+            if version in applied:
+                continue
+            for step in steps:
+                if isinstance(step, tuple):
+                    table, index_name, columns = step
+                    if not _index_exists(cur, table, index_name):
+                        cur.execute(f"CREATE INDEX {index_name} ON {table} ({columns})")
+                elif callable(step):
+                    step(cur)
+                else:
+                    cur.execute(step)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name),
+            )
+            done.append(version)
+        return done
+
+
+def _hot_queries() -> list[tuple]:
+    """
+    (label, sql, sample params, index EXPLAIN must show) for the hot
+    lookups. The SQL is the same module constant the function executes.
+    """
+    return [
+        ("get_student_exam_sheet_and_key", _EXAM_SHEET_ROW_SQL, (1, "0"), "idx_es_exam_prn"),
+        (
+            "load_exam_results / get_latest_exam_id_for_subject",
+            _LATEST_EXAM_SQL,
+            (1,),
+            "idx_exams_subject_created",
+        ),
+        ("_refresh_published_derived", _STALE_PUBLISHED_SQL, (40.0,), "idx_sp_published"),
+        ("list_students_for_course", _COURSE_STUDENTS_SQL, (1,), "idx_students_course_prn"),
+    ]
+
+
+def check_hot_query_indexes() -> dict:
     """
-    Runs SQL safely. If index already exists, ignore.
-    Prevents crashing when init_db() runs again.
+    EXPLAIN every hot query and check its plan uses the expected index.
+    Returns {label: {"ok": bool, "keys": indexes_used, "expected": index}}.
     """
+    conn = get_connection()
     try:
-        cur.execute(stmt)
-    except Error as e:
-        # ignore "Duplicate key name" / already exists
-        msg = str(e).lower()
-        if "duplicate key name" in msg or "already exists" in msg:
-            return
-        raise
+        cur = conn.cursor(dictionary=True)
+        out = {}
+        for label, sql, params, expected in _hot_queries():
+            cur.execute("EXPLAIN " + sql, params)
+            keys = [r.get("key") for r in cur.fetchall() or [] if r.get("key")]
+            out[label] = {"ok": expected in keys, "keys": keys, "expected": expected}
+        return out
+    finally:
+        conn.close()
 
 
 def init_db():
@@ -268,6 +557,104 @@ def init_db():
             FOREIGN KEY (question_paper_id) REFERENCES question_papers(id) ON DELETE CASCADE
         )
         """,
+        """
+        CREATE TABLE IF NOT EXISTS ocr_jobs (
+            pdf_sha256 CHAR(64) PRIMARY KEY,
+            pdf_path VARCHAR(255),
+            ocr_config VARCHAR(64) NULL,
+            total_pages INT NULL,
+            pages_done INT NOT NULL DEFAULT 0,
+            status VARCHAR(16) NOT NULL DEFAULT 'running',
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ocr_job_pages (
+            pdf_sha256 CHAR(64) NOT NULL,
+            page_no INT NOT NULL,
+            name VARCHAR(128),
+            prn VARCHAR(64),
+            answers_json TEXT NOT NULL,
+            image_path VARCHAR(255),
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (pdf_sha256, page_no),
+            FOREIGN KEY (pdf_sha256) REFERENCES ocr_jobs(pdf_sha256) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ocr_page_cache (
+            pixel_sha256 CHAR(64) PRIMARY KEY,
+            name VARCHAR(128),
+            prn VARCHAR(64),
+            answers_json TEXT NOT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ocr_queue (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            subject_id INT NOT NULL,
+            pdf_path VARCHAR(255) NOT NULL,
+            key_path VARCHAR(255) NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'queued',
+            pages_done INT NOT NULL DEFAULT 0,
+            total_pages INT NULL,
+            exam_id INT NULL,
+            error TEXT NULL,
+            claim_token CHAR(32) NULL,
+            worker_id VARCHAR(64) NULL,
+            lease_expires_at DATETIME NULL,
+            created_by INT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME NULL,
+            finished_at DATETIME NULL,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_ocr_queue_status (status, id),
+            INDEX idx_ocr_queue_subject (subject_id, id),
+            INDEX idx_ocr_queue_lease (status, lease_expires_at),
+            FOREIGN KEY (subject_id) REFERENCES subjects(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS exam_rank_totals (
+            exam_id INT NOT NULL,
+            theory_max DECIMAL(6,2) NOT NULL,
+            prn VARCHAR(64) NOT NULL,
+            total DECIMAL(8,2) NOT NULL,
+            rank_total INT NOT NULL,
+            PRIMARY KEY (exam_id, theory_max, prn),
+            FOREIGN KEY (exam_id) REFERENCES exams(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS exam_rank_summary (
+            exam_id INT NOT NULL,
+            theory_max DECIMAL(6,2) NOT NULL,
+            class_size INT NOT NULL,
+            class_avg_total DECIMAL(8,2) NULL,
+            refreshed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (exam_id, theory_max),
+            FOREIGN KEY (exam_id) REFERENCES exams(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS published_snapshots (
+            exam_id INT NOT NULL,
+            prn VARCHAR(64) NOT NULL,
+            payload MEDIUMTEXT NOT NULL,
+            PRIMARY KEY (exam_id, prn),
+            FOREIGN KEY (exam_id) REFERENCES exams(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS published_snapshot_state (
+            exam_id INT PRIMARY KEY,
+            subject_id INT NOT NULL,
+            built_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (exam_id) REFERENCES exams(id) ON DELETE CASCADE
+        )
+        """,
 
         # later you can extend for uploads/ocr results
     ]
@@ -277,10 +664,7 @@ def init_db():
         cur = conn.cursor()
         for stmt in ddl_statements:
             cur.execute(stmt)
-        _safe_execute(cur, "CREATE INDEX idx_students_course_last3 ON students (course_id, prn_last3)")
-        _safe_execute(cur, "CREATE INDEX idx_students_batch_course_last3 ON students (batch_id, course_id, prn_last3)")
-        _safe_execute(cur, "CREATE INDEX idx_qp_subject_created ON question_papers (subject_id, created_at)")
-        _safe_execute(cur, "CREATE INDEX idx_mcq_qp_qno ON mcq_bank (question_paper_id, question_no)")
+        run_migrations(conn)
 
     finally:
         conn.close()
@@ -436,6 +820,11 @@ def _normalize_prn(prn: str) -> str:
     # keep ONLY digits, remove spaces/junk
     return _digits_only(str(prn)).strip()
 
+
+def _normalize_exam_prn(prn: str) -> str:
+    """PRN as stored in exam_students: digits if any, else the trimmed OCR text."""
+    return _normalize_prn(prn) or str(prn or "").strip()
+
 # ------------------------------------------------------------------
 # Student operations (NEW)
 # ------------------------------------------------------------------
@@ -529,6 +918,12 @@ def upsert_student(
         conn.close()
 
 
+_STUDENT_IMPORT_CHUNK = 1000
+
+# column widths of the students table (checked before the insert)
+_STUDENT_FIELD_LIMITS = {"prn": 64, "name": 128, "phone": 20, "email": 128}
+
+
 def bulk_upsert_students_from_df(
     df,
     *,
@@ -544,11 +939,13 @@ def bulk_upsert_students_from_df(
     Required columns: PRN, Name
     Optional: Phone, Email
     Returns summary dict.
-    """
-    inserted_or_updated = 0
-    skipped = 0
-    errors = []
 
+    Vectorised: columns normalised with pandas string ops, then one
+    INSERT ... ON DUPLICATE KEY UPDATE executemany per chunk, in a single
+    transaction. New students get password = PRN; existing passwords are
+    never touched. A failing chunk is retried row by row (savepoint) so
+    errors are still reported per row.
+    """
     df.columns = [str(c).strip() for c in df.columns]
 
     # auto-detect PRN/Name if columns differ
@@ -573,40 +970,93 @@ def bulk_upsert_students_from_df(
             "skipped": len(df),
             "errors": [f"Required columns not found. Found columns: {list(df.columns)}"],
         }
-    for i, row in df.iterrows():
-        try:
-            raw_prn = row.get(prn_col, "")
-            prn = _normalize_prn(raw_prn)   # ✅ digits only
 
-            name = str(row.get(name_col, "")).strip()
+    def _optional(col):
+        if not col or col not in df.columns:
+            return pd.Series([None] * len(df), index=df.index, dtype=object)
+        v = df[col]
+        missing = v.isna() | (v.astype(str).str.lower() == "nan")
+        return v.astype(str).str.strip().where(~missing, None)
+
+    data = pd.DataFrame(
+        {
+            # ✅ digits only (same as _normalize_prn)
+            "prn": df[prn_col].fillna("").astype(str).str.replace(r"\D", "", regex=True),
+            "name": df[name_col].fillna("").astype(str).str.strip(),
+            "phone": _optional(phone_col),
+            "email": _optional(email_col),
+        },
+        index=df.index,
+    )
 
-            if not prn or not name.strip():
-                skipped += 1
-                continue
+    valid = (data["prn"] != "") & (data["name"] != "")
+    skipped = int((~valid).sum())
+    data = data[valid]
 
-            phone = None
-            email = None
-            if phone_col and phone_col in df.columns:
-                v = row.get(phone_col, None)
-                phone = None if v is None or str(v).lower() == "nan" else str(v).strip()
-            if email_col and email_col in df.columns:
-                v = row.get(email_col, None)
-                email = None if v is None or str(v).lower() == "nan" else str(v).strip()
-
-            ok = upsert_student(
-                prn=prn,
-                name=name,
-                phone=phone,
-                email=email,
-                batch_id=batch_id,
-                course_id=course_id,
-            )
-            if ok:
-                inserted_or_updated += 1
-            else:
-                skipped += 1
-        except Exception as e:
-            errors.append(f"Row {i}: {e}")
+    errors = []
+    too_long = pd.Series(False, index=data.index)
+    for col, limit in _STUDENT_FIELD_LIMITS.items():
+        over = data[col].notna() & (data[col].str.len() > limit)
+        for i in data.index[over.to_numpy()]:
+            errors.append(f"Row {i}: {col} longer than {limit} characters")
+        too_long |= over
+    data = data[~too_long]
+
+    if data.empty:
+        return {"inserted_or_updated": 0, "skipped": skipped, "errors": errors}
+
+    # default password = PRN (only used for NEW students)
+    hashes = {p: _hash_password(p) for p in data["prn"].unique()}
+    data = data.astype(object).where(data.notna(), None)
+    rows = [
+        (prn, name, phone, email, hashes[prn], batch_id, course_id)
+        for prn, name, phone, email in data[["prn", "name", "phone", "email"]].itertuples(index=False)
+    ]
+    row_index = list(data.index)
+
+    sql = """
+        INSERT INTO students (prn, name, phone, email, password_hash, batch_id, course_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            name = VALUES(name),
+            phone = VALUES(phone),
+            email = VALUES(email),
+            batch_id = VALUES(batch_id),
+            course_id = VALUES(course_id)
+    """
+
+    inserted_or_updated = 0
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        conn.start_transaction()
+
+        for start in range(0, len(rows), _STUDENT_IMPORT_CHUNK):
+            chunk = rows[start:start + _STUDENT_IMPORT_CHUNK]
+            cur.execute("SAVEPOINT student_chunk")
+            try:
+                cur.executemany(sql, chunk)
+                inserted_or_updated += len(chunk)
+            except Error:
+                cur.execute("ROLLBACK TO SAVEPOINT student_chunk")
+                for offset, row in enumerate(chunk):
+                    try:
+                        cur.execute(sql, row)
+                        inserted_or_updated += 1
+                    except Error as e:
+                        errors.append(f"Row {row_index[start + offset]}: {e}")
+                        skipped += 1
+
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return {
+            "inserted_or_updated": 0,
+            "skipped": skipped + len(rows),
+            "errors": errors + [f"Import rolled back: {e}"],
+        }
+    finally:
+        conn.close()
 
     return {
         "inserted_or_updated": inserted_or_updated,
@@ -802,19 +1252,19 @@ def admin_reset_student_password_to_prn(prn: str) -> bool:
         conn.close()
 
 
+_COURSE_STUDENTS_SQL = """
+    SELECT id, prn, name, phone, email, batch_id, course_id, created_at, updated_at
+    FROM students
+    WHERE course_id=%s
+    ORDER BY prn
+"""
+
+
 def list_students_for_course(course_id: int):
     conn = get_connection()
     try:
         cur = conn.cursor(dictionary=True)
-        cur.execute(
-            """
-            SELECT id, prn, name, phone, email, batch_id, course_id, created_at, updated_at
-            FROM students
-            WHERE course_id=%s
-            ORDER BY prn
-            """,
-            (course_id,),
-        )
+        cur.execute(_COURSE_STUDENTS_SQL, (course_id,))
         return cur.fetchall()
     finally:
         conn.close()
@@ -844,171 +1294,269 @@ def auto_link_exam_students_by_last3(exam_id: int) -> dict:
     """
     For a given exam_id:
     - find course_id, batch_id via exam -> subject -> course
-    - for each exam_student, match by last3 within (batch_id, course_id)
+    - match every exam_student by last3 (digits of stored PRN, zero-padded)
+      against students.prn_last3 within (batch_id, course_id)
     - if exactly 1 match, update exam_students prn+name, set is_conflict=0
+    Set-based: one counts query + one UPDATE ... JOIN, whatever the class size.
     """
+    # last-3 of the digits in es.prn ("21" -> "021"); NULL when no digits
+    es_last3 = """
+        CASE WHEN REGEXP_REPLACE(es.prn, '[^0-9]', '') = '' THEN NULL
+             ELSE LPAD(RIGHT(REGEXP_REPLACE(es.prn, '[^0-9]', ''), 3), 3, '0')
+        END
+    """
+
     conn = get_connection()
     try:
         cur = conn.cursor(dictionary=True)
 
-        # get subject_id for exam
-        cur.execute("SELECT subject_id FROM exams WHERE id=%s", (exam_id,))
+        # exam -> subject -> course -> batch
+        cur.execute(
+            """
+            SELECT c.id AS course_id, c.batch_id
+            FROM exams e
+            JOIN subjects s ON s.id = e.subject_id
+            JOIN courses c ON c.id = s.course_id
+            WHERE e.id = %s
+            """,
+            (exam_id,),
+        )
         r = cur.fetchone()
         if not r:
             return {"updated": 0, "conflicts": 0, "no_match": 0}
 
-        subject_id = int(r["subject_id"])
-
-        # get course_id from subject
-        cur.execute("SELECT course_id FROM subjects WHERE id=%s", (subject_id,))
-        r = cur.fetchone()
-        if not r:
-            return {"updated": 0, "conflicts": 0, "no_match": 0}
         course_id = int(r["course_id"])
+        batch_id = int(r["batch_id"]) if r["batch_id"] is not None else None
 
-        # get batch_id from course
-        cur.execute("SELECT batch_id FROM courses WHERE id=%s", (course_id,))
-        r = cur.fetchone()
-        batch_id = int(r["batch_id"]) if r and r["batch_id"] is not None else None
-
-        # fetch exam_students
-        cur.execute("SELECT id, prn FROM exam_students WHERE exam_id=%s", (exam_id,))
-        exam_rows = cur.fetchall() or []
-
-        updated = 0
-        conflicts = 0
-        no_match = 0
-
-        for row in exam_rows:
-            es_id = int(row["id"])
-            prn = str(row["prn"] or "")
-
-            digits = "".join(ch for ch in prn if ch.isdigit())
-            if not digits:
-                no_match += 1
-                continue
-
-            # ✅ if OCR dropped leading zeros (e.g., "21"), treat it as "021"
-            last3 = digits[-3:] if len(digits) >= 3 else digits.zfill(3)
-
-
-
+        conn.start_transaction()
 
-            # match in students table (scoped)
-            if batch_id is not None:
-                cur.execute(
-                    """
-                    SELECT prn, name
-                    FROM students
-                    WHERE batch_id=%s AND course_id=%s AND prn_last3=%s
-                    """,
-                    (batch_id, course_id, last3),
-                )
-            else:
-                cur.execute(
-                    """
-                    SELECT prn, name
-                    FROM students
-                    WHERE course_id=%s AND prn_last3=%s
-                    """,
-                    (course_id, last3),
-                )
+        # matches per exam_student -> updated / conflicts / no_match in one pass
+        cur.execute(
+            f"""
+            SELECT
+                COALESCE(SUM(m.matches = 1), 0) AS updated,
+                COALESCE(SUM(m.matches > 1), 0) AS conflicts,
+                COALESCE(SUM(m.matches = 0), 0) AS no_match
+            FROM (
+                SELECT es.id, COUNT(st.id) AS matches
+                FROM exam_students es
+                LEFT JOIN students st
+                  ON st.prn_last3 = {es_last3}
+                 AND st.course_id = %s
+                 AND (%s IS NULL OR st.batch_id = %s)
+                WHERE es.exam_id = %s
+                GROUP BY es.id
+            ) m
+            """,
+            (course_id, batch_id, batch_id, exam_id),
+        )
+        counts = cur.fetchone()
 
-            matches = cur.fetchall() or []
-            if len(matches) == 1:
-                m = matches[0]
-                cur2 = conn.cursor()
-                cur2.execute(
-                    """
-                    UPDATE exam_students
-                    SET prn=%s, name=%s, is_conflict=0
-                    WHERE id=%s
-                    """,
-                    (m["prn"], m["name"], es_id),
-                )
-                updated += 1
-            elif len(matches) == 0:
-                no_match += 1
-            else:
-                conflicts += 1
+        # apply every unique match in one multi-row UPDATE
+        cur.execute(
+            f"""
+            UPDATE exam_students es
+            JOIN (
+                SELECT prn_last3, MIN(prn) AS prn, MIN(name) AS name
+                FROM students
+                WHERE course_id = %s AND (%s IS NULL OR batch_id = %s)
+                GROUP BY prn_last3
+                HAVING COUNT(*) = 1
+            ) u ON u.prn_last3 = {es_last3}
+            SET es.prn = u.prn, es.name = u.name, es.is_conflict = 0
+            WHERE es.exam_id = %s
+            """,
+            (course_id, batch_id, batch_id, exam_id),
+        )
 
-        return {"updated": updated, "conflicts": conflicts, "no_match": no_match}
+        updated = int(counts["updated"])
+        if updated:
+            _invalidate_exam_derived(cur, exam_id=exam_id)
+        conn.commit()
+        if updated:
+            _refresh_published_derived()
 
+        return {
+            "updated": updated,
+            "conflicts": int(counts["conflicts"]),
+            "no_match": int(counts["no_match"]),
+        }
+    except Error:
+        conn.rollback()
+        raise
     finally:
         conn.close()
 
+_EXAM_STUDENTS_CHUNK = 1000
+_EXAM_ANSWERS_CHUNK = 5000
+
+
 def save_exam_results(subject_id: int, pdf_path: str, key_path: str, students: dict) -> int:
+    """
+    Insert one exam with all its attempts + answers in ONE transaction:
+    multi-row exam_students insert, ids mapped back by insertion order,
+    exam_answers in large chunks. Rolls back completely on failure.
+    """
     conn = get_connection()
     try:
         cur = conn.cursor()
-
-        # create exam
-        cur.execute(
-            """
-            INSERT INTO exams (subject_id, pdf_path, key_path)
-            VALUES (%s, %s, %s)
-            """,
-            (subject_id, pdf_path, key_path),
-        )
-        exam_id = cur.lastrowid
-
-        # insert students + answers
-        for prn, entries in students.items():
-            is_conflict = 1 if len(entries) > 1 else 0
-
-            for entry in entries:
-                cur.execute(
-                    """
-                    INSERT INTO exam_students
-                        (exam_id, prn, name, score, total_questions, image_path, is_conflict)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """,
-                    (
-                        exam_id,
-                        prn,
-                        entry.get("name", "Unknown"),
-                        int(entry.get("score", 0)),
-                        int(entry.get("total", 0)),
-                        entry.get("image_path"),
-                        is_conflict,
-                    ),
-                )
-
-                exam_student_id = cur.lastrowid
-
-                answer_rows = []
-                for d in entry.get("details", []):
-                    student_answer = d["student_answer"]
-                    if student_answer == "(blank)":
-                        student_answer = None
-
-                    answer_rows.append(
-                        (
-                            exam_student_id,
-                            int(d["question"]),
-                            student_answer,
-                            d["key_answer"],
-                            int(d["is_correct"]),
-                            int(d["is_blank"]),
-                        )
-                    )
-
-                if answer_rows:
-                    cur.executemany(
-                        """
-                        INSERT INTO exam_answers
-                            (exam_student_id, question_no, student_answer,
-                             key_answer, is_correct, is_blank)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        """,
-                        answer_rows,
-                    )
-
+        conn.start_transaction()
+        exam_id = _insert_exam_results(cur, subject_id, pdf_path, key_path, students)
+        conn.commit()
         return exam_id
+    except Exception:
+        conn.rollback()
+        raise
     finally:
         conn.close()
 
 
+def _insert_exam_results(cur, subject_id: int, pdf_path: str, key_path: str, students: dict) -> int:
+    """save_exam_results statements on an open transaction (db_bench.py runs it too)."""
+    # flatten attempts in a fixed order (ids are mapped back in this order);
+    # conflicts are counted on the PRN as stored ("12 3" and "123" clash)
+    attempts = [
+        (_normalize_exam_prn(prn), entry)
+        for prn, entries in students.items()
+        for entry in entries
+    ]
+    per_prn = {}
+    for prn, _ in attempts:
+        per_prn[prn] = per_prn.get(prn, 0) + 1
+
+    # create exam
+    cur.execute(
+        """
+        INSERT INTO exams (subject_id, pdf_path, key_path)
+        VALUES (%s, %s, %s)
+        """,
+        (subject_id, pdf_path, key_path),
+    )
+    exam_id = cur.lastrowid
+
+    # insert students (executemany -> multi-row INSERT)
+    student_rows = [
+        (
+            exam_id,
+            prn,
+            entry.get("name", "Unknown"),
+            int(entry.get("score", 0)),
+            int(entry.get("total", 0)),
+            entry.get("image_path"),
+            1 if per_prn[prn] > 1 else 0,
+        )
+        for prn, entry in attempts
+    ]
+    for i in range(0, len(student_rows), _EXAM_STUDENTS_CHUNK):
+        cur.executemany(
+            """
+            INSERT INTO exam_students
+                (exam_id, prn, name, score, total_questions, image_path, is_conflict)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """,
+            student_rows[i:i + _EXAM_STUDENTS_CHUNK],
+        )
+
+    # new exam, this transaction only -> id order == insertion order
+    cur.execute("SELECT id FROM exam_students WHERE exam_id = %s ORDER BY id", (exam_id,))
+    student_ids = [int(r[0]) for r in cur.fetchall()]
+    if len(student_ids) != len(attempts):
+        raise RuntimeError(
+            f"exam_students id mapping mismatch: {len(student_ids)} ids for {len(attempts)} rows"
+        )
+
+    # insert answers
+    answer_rows = []
+    for exam_student_id, (_, entry) in zip(student_ids, attempts):
+        for d in entry.get("details", []):
+            student_answer = d["student_answer"]
+            if student_answer == "(blank)":
+                student_answer = None
+
+            answer_rows.append(
+                (
+                    exam_student_id,
+                    int(d["question"]),
+                    student_answer,
+                    d["key_answer"],
+                    int(d["is_correct"]),
+                    int(d["is_blank"]),
+                )
+            )
+
+    for i in range(0, len(answer_rows), _EXAM_ANSWERS_CHUNK):
+        cur.executemany(
+            """
+            INSERT INTO exam_answers
+                (exam_student_id, question_no, student_answer,
+                 key_answer, is_correct, is_blank)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """,
+            answer_rows[i:i + _EXAM_ANSWERS_CHUNK],
+        )
+
+    return exam_id
+
+
+
+_LATEST_EXAM_SQL = """
+    SELECT id, pdf_path, key_path
+    FROM exams
+    WHERE subject_id = %s
+    ORDER BY created_at DESC
+    LIMIT 1
+"""
+
+# all attempts + answers of one exam (db_bench.py runs this same query)
+_EXAM_RESULTS_SQL = """
+    SELECT es.id, es.prn, es.name, es.score, es.total_questions, es.image_path,
+           ea.question_no, ea.student_answer, ea.key_answer, ea.is_correct, ea.is_blank
+    FROM exam_students es
+    LEFT JOIN exam_answers ea ON ea.exam_student_id = es.id
+    WHERE es.exam_id = %s
+    ORDER BY es.id, ea.question_no
+"""
+
+
+def _group_exam_result_rows(rows):
+    """_EXAM_RESULTS_SQL rows -> (answer_key, {prn: [attempt, ...]})."""
+    key_map = {}
+    students = {}
+    entry = None
+
+    for (exam_student_id, prn, name, score, total, image_path,
+         q_no, s_ans, k_ans, is_corr, is_blank) in rows:
+        if entry is None or entry["exam_student_id"] != exam_student_id:
+            entry = {
+                "exam_student_id": exam_student_id,
+                "name": name,
+                "prn": prn,
+                "score": int(score),
+                "total": int(total),
+                "image_path": image_path,
+                "details": [],
+            }
+            students.setdefault(prn, []).append(entry)
+
+        if q_no is None:
+            continue  # student without answer rows
+
+        k_ans = (k_ans or "").strip().upper()
+        if q_no not in key_map:
+            key_map[q_no] = k_ans
+
+        entry["details"].append(
+            {
+                "question": int(q_no),
+                "student_answer": s_ans if s_ans else "(blank)",
+                "key_answer": k_ans,
+                "is_correct": bool(is_corr),
+                "is_blank": bool(is_blank),
+            }
+        )
+
+    return key_map, students
+
 
 def load_exam_results(subject_id: int):
     """
@@ -1038,168 +1586,1014 @@ def load_exam_results(subject_id: int):
         cur = conn.cursor()
 
         # latest exam for this subject
+        cur.execute(_LATEST_EXAM_SQL, (subject_id,))
+        row = cur.fetchone()
+        if not row:
+            return None
+
+        exam_id, pdf_path, key_path = row
+
+        # all students + answers in ONE query (ordered by student, then question)
+        cur.execute(_EXAM_RESULTS_SQL, (exam_id,))
+        key_map, students = _group_exam_result_rows(cur.fetchall())
+
+        return {
+            "exam_id": exam_id,
+            "pdf_path": pdf_path,
+            "key_path": key_path,
+            "answer_key": key_map,
+            "students": students,
+        }
+    finally:
+        conn.close()
+
+
+
+# ------------------------------------------------------------------
+# OCR jobs (resume / checkpoint per PDF page)
+# ------------------------------------------------------------------
+def start_ocr_job(pdf_sha256: str, pdf_path: str, ocr_config: str) -> dict:
+    """
+    Create (or reopen) the OCR job for a PDF, keyed by its content hash.
+    A job made under a different ocr_config (config.OCR_RESULT_CONFIG) is a
+    miss: its checkpointed pages are dropped and the PDF is OCR'd again.
+    Returns already finished pages: {page_no: page_result}, empty for a new PDF.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        conn.start_transaction()
+        cur.execute(
+            "SELECT ocr_config FROM ocr_jobs WHERE pdf_sha256 = %s FOR UPDATE",
+            (pdf_sha256,),
+        )
+        row = cur.fetchone()
+        if row and row[0] != ocr_config:
+            cur.execute("DELETE FROM ocr_job_pages WHERE pdf_sha256 = %s", (pdf_sha256,))
+            cur.execute(
+                """
+                UPDATE ocr_jobs
+                SET pdf_path = %s, ocr_config = %s, status = 'running',
+                    total_pages = NULL, pages_done = 0
+                WHERE pdf_sha256 = %s
+                """,
+                (pdf_path, ocr_config, pdf_sha256),
+            )
+        else:
+            cur.execute(
+                """
+                INSERT INTO ocr_jobs (pdf_sha256, pdf_path, ocr_config, status)
+                VALUES (%s, %s, %s, 'running')
+                ON DUPLICATE KEY UPDATE
+                    pdf_path = VALUES(pdf_path),
+                    status = IF(status = 'done', 'done', 'running')
+                """,
+                (pdf_sha256, pdf_path, ocr_config),
+            )
+        conn.commit()
+    except Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return load_ocr_job_pages(pdf_sha256)
+
+
+def get_ocr_job(pdf_sha256: str) -> dict | None:
+    """Returns {pdf_sha256, ocr_config, status, total_pages, pages_done} or None."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
         cur.execute(
             """
-            SELECT id, pdf_path, key_path
-            FROM exams
-            WHERE subject_id = %s
-            ORDER BY created_at DESC
-            LIMIT 1
+            SELECT pdf_sha256, ocr_config, status, total_pages, pages_done
+            FROM ocr_jobs
+            WHERE pdf_sha256 = %s
             """,
-            (subject_id,),
+            (pdf_sha256,),
+        )
+        return cur.fetchone()
+    finally:
+        conn.close()
+
+
+def load_ocr_job_pages(pdf_sha256: str) -> dict:
+    """
+    Returns {page_no: {"page", "name", "prn", "answers", "image_path"}}
+    in the same shape main.process_pdf produces.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT page_no, name, prn, answers_json, image_path
+            FROM ocr_job_pages
+            WHERE pdf_sha256 = %s
+            ORDER BY page_no
+            """,
+            (pdf_sha256,),
+        )
+        pages = {}
+        for page_no, name, prn, answers_json, image_path in cur.fetchall():
+            answers = {int(q): a for q, a in json.loads(answers_json or "{}").items()}
+            pages[int(page_no)] = {
+                "page": int(page_no),
+                "name": name,
+                "prn": prn,
+                "answers": answers,
+                "image_path": image_path,
+            }
+        return pages
+    finally:
+        conn.close()
+
+
+def save_ocr_job_page(pdf_sha256: str, page: dict) -> None:
+    """Checkpoint one finished page (called as soon as the page is OCR'd)."""
+    answers_json = json.dumps({str(q): a for q, a in (page.get("answers") or {}).items()})
+
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO ocr_job_pages (pdf_sha256, page_no, name, prn, answers_json, image_path)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                name = VALUES(name),
+                prn = VALUES(prn),
+                answers_json = VALUES(answers_json),
+                image_path = VALUES(image_path)
+            """,
+            (
+                pdf_sha256,
+                int(page["page"]),
+                page.get("name"),
+                page.get("prn"),
+                answers_json,
+                page.get("image_path"),
+            ),
+        )
+        cur.execute(
+            """
+            UPDATE ocr_jobs
+            SET pages_done = (SELECT COUNT(*) FROM ocr_job_pages WHERE pdf_sha256 = %s)
+            WHERE pdf_sha256 = %s
+            """,
+            (pdf_sha256, pdf_sha256),
+        )
+    finally:
+        conn.close()
+
+
+def finish_ocr_job(pdf_sha256: str, total_pages: int) -> str:
+    """
+    Record the page count and close the job.
+    Status is 'done' only if every page has a checkpoint, else 'partial'
+    (a rerun then retries just the failed pages).
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE ocr_jobs
+            SET total_pages = %s,
+                status = IF(pages_done >= %s, 'done', 'partial')
+            WHERE pdf_sha256 = %s
+            """,
+            (total_pages, total_pages, pdf_sha256),
+        )
+        cur.execute("SELECT status FROM ocr_jobs WHERE pdf_sha256 = %s", (pdf_sha256,))
+        row = cur.fetchone()
+        return row[0] if row else "missing"
+    finally:
+        conn.close()
+
+
+def get_cached_ocr_page(pixel_sha256: str) -> dict | None:
+    """Raw OCR output for a page with these exact pixels: {name, prn, answers} or None."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT name, prn, answers_json FROM ocr_page_cache WHERE pixel_sha256 = %s",
+            (pixel_sha256,),
         )
         row = cur.fetchone()
         if not row:
             return None
+        name, prn, answers_json = row
+        answers = {int(q): a for q, a in json.loads(answers_json or "{}").items()}
+        return {"name": name, "prn": prn, "answers": answers}
+    finally:
+        conn.close()
 
-        exam_id, pdf_path, key_path = row
 
-        # get all students for this exam
+def save_cached_ocr_page(pixel_sha256: str, page: dict) -> None:
+    answers_json = json.dumps({str(q): a for q, a in (page.get("answers") or {}).items()})
+
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
         cur.execute(
             """
-            SELECT id, prn, name, score, total_questions, image_path
-            FROM exam_students
-            WHERE exam_id = %s
+            INSERT IGNORE INTO ocr_page_cache (pixel_sha256, name, prn, answers_json)
+            VALUES (%s, %s, %s, %s)
             """,
-            (exam_id,),
+            (pixel_sha256, page.get("name"), page.get("prn"), answers_json),
         )
-        students_rows = cur.fetchall()
+    finally:
+        conn.close()
 
-        key_map = {}
-        students = {}
 
-        for exam_student_id, prn, name, score, total, image_path in students_rows:
-            cur_answers = conn.cursor()
-            cur_answers.execute(
-                """
-                SELECT question_no, student_answer, key_answer, is_correct, is_blank
-                FROM exam_answers
-                WHERE exam_student_id = %s
-                ORDER BY question_no
-                """,
-                (exam_student_id,),
-            )
+# ------------------------------------------------------------------
+# OCR queue (uploads processed by ocr_worker.py, polled by admin page)
+# ------------------------------------------------------------------
+def enqueue_ocr_queue_job(
+    subject_id: int, pdf_path: str, key_path: str, created_by: int | None = None
+) -> int:
+    """Queue an uploaded answer-sheet PDF for the background worker. Returns job id."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO ocr_queue (subject_id, pdf_path, key_path, created_by)
+            VALUES (%s, %s, %s, %s)
+            """,
+            (subject_id, pdf_path, key_path, created_by),
+        )
+        return int(cur.lastrowid)
+    finally:
+        conn.close()
 
-            details = []
-            for q_no, s_ans, k_ans, is_corr, is_blank in cur_answers.fetchall():
-                k_ans = (k_ans or "").strip().upper()
-                if q_no not in key_map:
-                    key_map[q_no] = k_ans
-
-                student_answer = s_ans if s_ans else "(blank)"
-
-                details.append(
-                    {
-                        "question": int(q_no),
-                        "student_answer": student_answer,
-                        "key_answer": k_ans,
-                        "is_correct": bool(is_corr),
-                        "is_blank": bool(is_blank),
-                    }
-                )
 
-            if prn not in students:
-                students[prn] = []
+def claim_next_ocr_queue_job(
+    claim_token: str, worker_id: str, lease_seconds: int
+) -> dict | None:
+    """
+    Atomically take the oldest queued job (safe with several workers), or a
+    'running' job whose lease has expired (its worker died). The claimer
+    holds a lease for lease_seconds and must keep renewing it
+    (renew_ocr_queue_lease) while the job runs.
+    Returns the job row dict or None if nothing is claimable.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(
+            """
+            UPDATE ocr_queue
+            SET status='running', claim_token=%s, worker_id=%s,
+                lease_expires_at=NOW() + INTERVAL %s SECOND,
+                started_at=NOW(), error=NULL
+            WHERE status='queued'
+               OR (status='running' AND lease_expires_at < NOW())
+            ORDER BY id
+            LIMIT 1
+            """,
+            (claim_token, worker_id[:64], int(lease_seconds)),
+        )
+        if cur.rowcount == 0:
+            return None
 
-            students[prn].append(
-                {
-                    "exam_student_id": exam_student_id,
-                    "name": name,
-                    "prn": prn,
-                    "score": int(score),
-                    "total": int(total),
-                    "image_path": image_path,
-                    "details": details,
-                }
-            )
+        cur.execute(
+            """
+            SELECT id, subject_id, pdf_path, key_path, created_by
+            FROM ocr_queue
+            WHERE claim_token=%s AND status='running'
+            LIMIT 1
+            """,
+            (claim_token,),
+        )
+        return cur.fetchone()
+    finally:
+        conn.close()
 
-        return {
-            "exam_id": exam_id,
-            "pdf_path": pdf_path,
-            "key_path": key_path,
-            "answer_key": key_map,
-            "students": students,
-        }
+
+def renew_ocr_queue_lease(job_id: int, claim_token: str, lease_seconds: int) -> bool:
+    """
+    Heartbeat: push the lease of a job we still own forward.
+    False means the lease was lost (expired and claimed by another worker).
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE ocr_queue
+            SET lease_expires_at = NOW() + INTERVAL %s SECOND
+            WHERE id=%s AND claim_token=%s AND status='running'
+            """,
+            (int(lease_seconds), job_id, claim_token),
+        )
+        return cur.rowcount > 0
     finally:
         conn.close()
 
 
+def update_ocr_queue_progress(
+    job_id: int, claim_token: str, pages_done: int, total_pages: int
+) -> None:
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE ocr_queue SET pages_done=%s, total_pages=%s
+            WHERE id=%s AND claim_token=%s
+            """,
+            (pages_done, total_pages, job_id, claim_token),
+        )
+    finally:
+        conn.close()
+
 
-def update_exam_student_answers(exam_student_id: int, score: int, details: list):
+def complete_ocr_queue_job(job_id: int, claim_token: str, exam_id: int) -> bool:
+    """Mark done. False if this worker no longer owns the job."""
     conn = get_connection()
     try:
         cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE ocr_queue
+            SET status='done', exam_id=%s, finished_at=NOW(), lease_expires_at=NULL
+            WHERE id=%s AND claim_token=%s
+            """,
+            (exam_id, job_id, claim_token),
+        )
+        return cur.rowcount > 0
+    finally:
+        conn.close()
+
 
+def fail_ocr_queue_job(job_id: int, claim_token: str, error: str) -> bool:
+    """Mark failed. False if this worker no longer owns the job."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
         cur.execute(
-            "UPDATE exam_students SET score = %s WHERE id = %s",
-            (score, exam_student_id),
+            """
+            UPDATE ocr_queue
+            SET status='failed', error=%s, finished_at=NOW(), lease_expires_at=NULL
+            WHERE id=%s AND claim_token=%s
+            """,
+            (str(error)[:2000], job_id, claim_token),
         )
+        return cur.rowcount > 0
+    finally:
+        conn.close()
 
+
+def list_ocr_queue_jobs(subject_id: int, limit: int = 10) -> list[dict]:
+    """Latest queue jobs for a subject (newest first) for the admin status table."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
         cur.execute(
-            "DELETE FROM exam_answers WHERE exam_student_id = %s",
-            (exam_student_id,),
+            """
+            SELECT id, status, pages_done, total_pages, exam_id, error,
+                   created_at, started_at, finished_at
+            FROM ocr_queue
+            WHERE subject_id=%s
+            ORDER BY id DESC
+            LIMIT %s
+            """,
+            (subject_id, int(limit)),
         )
+        return cur.fetchall() or []
+    finally:
+        conn.close()
 
-        answer_rows = []
-        for d in details:
-            student_answer = d["student_answer"]
-            if student_answer == "(blank)":
-                student_answer = None
 
-            answer_rows.append(
-                (
-                    exam_student_id,
-                    int(d["question"]),
-                    student_answer,
-                    d["key_answer"],
-                    int(d["is_correct"]),
-                    int(d["is_blank"]),
-                )
-            )
+def update_exam_student_answers(exam_student_id: int, score: int, details: list):
+    """
+    Save an edited attempt: only questions whose stored row differs are
+    upserted (UNIQUE exam_student_id, question_no), rows for questions no
+    longer in details are dropped, and score is recomputed in SQL from
+    is_correct. One transaction. `score` is kept for callers; the stored
+    score always matches the answers.
+    """
+    wanted = {}
+    for d in details:
+        student_answer = d["student_answer"]
+        if student_answer == "(blank)":
+            student_answer = None
+
+        wanted[int(d["question"])] = (
+            student_answer,
+            d["key_answer"],
+            int(d["is_correct"]),
+            int(d["is_blank"]),
+        )
 
-        if answer_rows:
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        conn.start_transaction()
+
+        # lock this attempt's answers while diffing
+        cur.execute(
+            """
+            SELECT question_no, student_answer, key_answer, is_correct, is_blank
+            FROM exam_answers
+            WHERE exam_student_id = %s
+            FOR UPDATE
+            """,
+            (exam_student_id,),
+        )
+        current = {
+            int(q): (sa, ka, int(ic), int(ib))
+            for q, sa, ka, ic, ib in cur.fetchall()
+        }
+
+        changed = [
+            (exam_student_id, q) + row
+            for q, row in wanted.items()
+            if current.get(q) != row
+        ]
+        removed = [q for q in current if q not in wanted]
+
+        if changed:
             cur.executemany(
                 """
                 INSERT INTO exam_answers
                     (exam_student_id, question_no, student_answer,
                      key_answer, is_correct, is_blank)
                 VALUES (%s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    student_answer = VALUES(student_answer),
+                    key_answer = VALUES(key_answer),
+                    is_correct = VALUES(is_correct),
+                    is_blank = VALUES(is_blank)
+                """,
+                changed,
+            )
+
+        if removed:
+            placeholders = ",".join(["%s"] * len(removed))
+            cur.execute(
+                f"""
+                DELETE FROM exam_answers
+                WHERE exam_student_id = %s AND question_no IN ({placeholders})
+                """,
+                [exam_student_id] + removed,
+            )
+
+        cur.execute(
+            """
+            UPDATE exam_students es
+            SET es.score = (
+                SELECT COALESCE(SUM(ea.is_correct), 0)
+                FROM exam_answers ea
+                WHERE ea.exam_student_id = es.id
+            )
+            WHERE es.id = %s
+            """,
+            (exam_student_id,),
+        )
+        _invalidate_exam_derived(cur, exam_student_id=exam_student_id)
+
+        conn.commit()
+    except Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    _refresh_published_derived()
+
+
+def update_exam_student_identity(exam_student_id: int, new_prn: str, new_name: str) -> str:
+    """Set PRN + name of one attempt. Returns the PRN as stored (normalised)."""
+    stored_prn = _normalize_exam_prn(new_prn)
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE exam_students
+            SET prn = %s, name = %s, is_conflict = 0
+            WHERE id = %s
+            """,
+            (stored_prn, new_name, exam_student_id),
+        )
+        _invalidate_exam_derived(cur, exam_student_id=exam_student_id)
+    finally:
+        conn.close()
+
+    _refresh_published_derived()
+    return stored_prn
+
+
+def rekey_exam(exam_id: int, key_map: dict, key_path: str | None = None) -> dict:
+    """
+    Re-score an existing exam against a corrected key (no OCR).
+    key_map: {q_no: option}. Same rules as a fresh run: questions not in
+    the key are dropped, new key questions count as blank.
+    Set-based: a temp key table + UPDATE ... JOIN, all in one transaction.
+    """
+    key_rows = [
+        (int(q), "" if a is None else str(a).strip().upper())
+        for q, a in key_map.items()
+    ]
+    if not key_rows:
+        return {"ok": False, "error": "Answer key is empty."}
+
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        conn.start_transaction()
+
+        cur.execute(
+            """
+            CREATE TEMPORARY TABLE tmp_rekey (
+                question_no INT PRIMARY KEY,
+                key_answer VARCHAR(8)
+            )
+            """
+        )
+        cur.executemany(
+            "INSERT INTO tmp_rekey (question_no, key_answer) VALUES (%s, %s)",
+            key_rows,
+        )
+
+        # questions no longer in the key
+        cur.execute(
+            """
+            DELETE ea FROM exam_answers ea
+            JOIN exam_students es ON es.id = ea.exam_student_id
+            LEFT JOIN tmp_rekey k ON k.question_no = ea.question_no
+            WHERE es.exam_id = %s AND k.question_no IS NULL
+            """,
+            (exam_id,),
+        )
+
+        # new key questions -> blank answers
+        cur.execute(
+            """
+            INSERT INTO exam_answers
+                (exam_student_id, question_no, student_answer,
+                 key_answer, is_correct, is_blank)
+            SELECT es.id, k.question_no, NULL, k.key_answer, 0, 1
+            FROM exam_students es
+            CROSS JOIN tmp_rekey k
+            LEFT JOIN exam_answers ea
+                ON ea.exam_student_id = es.id AND ea.question_no = k.question_no
+            WHERE es.exam_id = %s AND ea.id IS NULL
+            """,
+            (exam_id,),
+        )
+
+        cur.execute(
+            """
+            UPDATE exam_answers ea
+            JOIN exam_students es ON es.id = ea.exam_student_id
+            JOIN tmp_rekey k ON k.question_no = ea.question_no
+            SET ea.key_answer = k.key_answer,
+                ea.is_correct = COALESCE(ea.is_blank = 0 AND ea.student_answer = k.key_answer, 0)
+            WHERE es.exam_id = %s
+            """,
+            (exam_id,),
+        )
+
+        cur.execute(
+            """
+            UPDATE exam_students es
+            LEFT JOIN (
+                SELECT ea.exam_student_id, SUM(ea.is_correct) AS score
+                FROM exam_answers ea
+                JOIN exam_students es2 ON es2.id = ea.exam_student_id
+                WHERE es2.exam_id = %s
+                GROUP BY ea.exam_student_id
+            ) s ON s.exam_student_id = es.id
+            SET es.score = COALESCE(s.score, 0),
+                es.total_questions = %s
+            WHERE es.exam_id = %s
+            """,
+            (exam_id, len(key_rows), exam_id),
+        )
+        scores_changed = cur.rowcount
+
+        if key_path:
+            cur.execute(
+                "UPDATE exams SET key_path = %s WHERE id = %s",
+                (key_path, exam_id),
+            )
+
+        _invalidate_exam_derived(cur, exam_id=exam_id)
+        conn.commit()
+        _refresh_published_derived()
+        return {"ok": True, "exam_id": exam_id, "scores_changed": scores_changed}
+    except Error as e:
+        conn.rollback()
+        return {"ok": False, "error": str(e)}
+    finally:
+        try:
+            cur.execute("DROP TEMPORARY TABLE IF EXISTS tmp_rekey")
+        except Exception:
+            pass
+        conn.close()
+
+
+# ------------------------------------------------------------------
+# Precomputed per-exam totals / dense ranks (student dashboard)
+# total = theory scaled to theory_max + lab marks; one summary row per
+# (exam, theory_max) marks the table as fresh. Edits delete the summary
+# row (_invalidate_exam_derived) and rebuild published exams right after
+# (_refresh_published_derived); reads never write, they compute stale
+# ranks live instead.
+# ------------------------------------------------------------------
+def _invalidate_exam_derived(
+    cur,
+    *,
+    exam_id: int | None = None,
+    subject_id: int | None = None,
+    exam_student_id: int | None = None,
+    ranks: bool = True,
+    snapshot: bool = True,
+):
+    """
+    Mark per-exam derived data (rank totals, student snapshot) stale for an
+    exam: directly, via one of its exam_students rows, or every exam of a subject.
+    ranks / snapshot pick what the edit actually affects (lab marks only feed
+    the ranks, MCQ text only the snapshot).
+    """
+    tables = []
+    if ranks:
+        tables.append("exam_rank_summary")
+    if snapshot:
+        tables.append("published_snapshot_state")
+    for table in tables:
+        if exam_id is not None:
+            cur.execute(f"DELETE FROM {table} WHERE exam_id = %s", (exam_id,))
+        if subject_id is not None:
+            cur.execute(
+                f"""
+                DELETE d FROM {table} d
+                JOIN exams e ON e.id = d.exam_id
+                WHERE e.subject_id = %s
+                """,
+                (subject_id,),
+            )
+        if exam_student_id is not None:
+            cur.execute(
+                f"""
+                DELETE d FROM {table} d
+                JOIN exam_students es ON es.exam_id = d.exam_id
+                WHERE es.id = %s
                 """,
-                answer_rows,
+                (exam_student_id,),
             )
+
+
+# total per attempt, every attempt counts for class size / avg / ranking;
+# a PRN keeps its best dense rank. Params: (theory_max, exam_id)
+_RANKED_TOTALS_SQL = """
+    SELECT exam_id, prn, total, rank_total
+    FROM (
+        SELECT t.exam_id, t.prn, t.total,
+               DENSE_RANK() OVER (ORDER BY t.total DESC) AS rank_total,
+               ROW_NUMBER() OVER (PARTITION BY t.prn ORDER BY t.total DESC) AS rn
+        FROM (
+            SELECT es.exam_id, es.prn,
+                   ROUND(
+                       ROUND(CASE WHEN es.total_questions > 0
+                                  THEN es.score / es.total_questions * %s
+                                  ELSE 0 END, 2)
+                       + COALESCE(lm.marks, 0), 2
+                   ) AS total
+            FROM exam_students es
+            JOIN exams e ON e.id = es.exam_id
+            LEFT JOIN lab_marks lm ON lm.subject_id = e.subject_id AND lm.prn = es.prn
+            WHERE es.exam_id = %s
+        ) t
+    ) ranked
+    WHERE rn = 1
+"""
+
+# class size + average total. Params: (theory_max, exam_id)
+_RANK_SUMMARY_SQL = """
+    SELECT COUNT(*) AS class_size,
+           ROUND(AVG(ROUND(
+               ROUND(CASE WHEN es.total_questions > 0
+                          THEN es.score / es.total_questions * %s
+                          ELSE 0 END, 2)
+               + COALESCE(lm.marks, 0), 2)), 2) AS class_avg_total
+    FROM exam_students es
+    JOIN exams e ON e.id = es.exam_id
+    LEFT JOIN lab_marks lm ON lm.subject_id = e.subject_id AND lm.prn = es.prn
+    WHERE es.exam_id = %s
+"""
+
+
+def refresh_exam_rank_totals(exam_id: int, theory_max: float = 40.0) -> bool:
+    """
+    Rebuild exam_rank_totals + exam_rank_summary for one exam (set-based).
+    Admin side only (publish / edits). Concurrent rebuilds of the same exam
+    are serialised; returns False if the lock could not be taken.
+    """
+    conn = get_connection()
+    try:
+        with _advisory_lock(conn, f"omr_exam_ranks_{int(exam_id)}", 30) as locked:
+            if not locked:
+                return False
+
+            cur = conn.cursor()
+            conn.start_transaction()
+            try:
+                cur.execute(
+                    "DELETE FROM exam_rank_totals WHERE exam_id = %s AND theory_max = %s",
+                    (exam_id, theory_max),
+                )
+                cur.execute(
+                    """
+                    INSERT INTO exam_rank_totals (exam_id, theory_max, prn, total, rank_total)
+                    SELECT r.exam_id, %s, r.prn, r.total, r.rank_total
+                    FROM ("""
+                    + _RANKED_TOTALS_SQL
+                    + """) r
+                    """,
+                    (theory_max, theory_max, exam_id),
+                )
+                cur.execute(
+                    """
+                    INSERT INTO exam_rank_summary (exam_id, theory_max, class_size, class_avg_total)
+                    SELECT %s, %s, s.class_size, s.class_avg_total
+                    FROM ("""
+                    + _RANK_SUMMARY_SQL
+                    + """) s
+                    ON DUPLICATE KEY UPDATE
+                        class_size = VALUES(class_size),
+                        class_avg_total = VALUES(class_avg_total),
+                        refreshed_at = CURRENT_TIMESTAMP
+                    """,
+                    (exam_id, theory_max, theory_max, exam_id),
+                )
+                conn.commit()
+            except Error:
+                conn.rollback()
+                raise
+            return True
     finally:
         conn.close()
 
 
-def update_exam_student_identity(exam_student_id: int, new_prn: str, new_name: str):
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            UPDATE exam_students
-            SET prn = %s, name = %s, is_conflict = 0
-            WHERE id = %s
-            """,
-            (new_prn, new_name, exam_student_id),
-        )
-    finally:
-        conn.close()
+def _live_exam_rank(cur, exam_id: int, prn: str, theory_max: float) -> dict:
+    """
+    Read-only fallback while an exam's precomputed ranks are stale:
+    {"class_size", "class_avg_total", "rank_total"} computed on the fly.
+    """
+    cur.execute(_RANK_SUMMARY_SQL, (theory_max, exam_id))
+    out = dict(cur.fetchone() or {})
+    cur.execute(
+        "SELECT r.rank_total FROM (" + _RANKED_TOTALS_SQL + ") r WHERE r.prn = %s",
+        (theory_max, exam_id, prn),
+    )
+    row = cur.fetchone()
+    out["rank_total"] = row["rank_total"] if row else None
+    return out
+
+
+# published exams with invalidated ranks / snapshot. Params: (theory_max,)
+_STALE_PUBLISHED_SQL = """
+    SELECT sp.exam_id,
+           rs.exam_id IS NULL AS ranks_stale,
+           st.exam_id IS NULL AS snapshot_stale
+    FROM subject_publish sp
+    LEFT JOIN exam_rank_summary rs
+        ON rs.exam_id = sp.exam_id AND rs.theory_max = %s
+    LEFT JOIN published_snapshot_state st ON st.exam_id = sp.exam_id
+    WHERE sp.is_published = 1
+      AND (rs.exam_id IS NULL OR st.exam_id IS NULL)
+"""
+
+
+def _refresh_published_derived(theory_max: float = 40.0) -> None:
+    """
+    After an admin edit: rebuild the precomputed ranks / student snapshot of
+    every published exam that was invalidated, so student reads never have to.
+    Not fatal: until it succeeds students get live queries instead.
+    """
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(_STALE_PUBLISHED_SQL, (theory_max,))
+            stale = cur.fetchall()
+        finally:
+            conn.close()
+
+        for exam_id, ranks_stale, snapshot_stale in stale:
+            if ranks_stale:
+                refresh_exam_rank_totals(int(exam_id), theory_max)
+            if snapshot_stale:
+                build_published_snapshot(int(exam_id))
+    except Error as e:
+        print("DB refresh published derived data error:", e)
+
+
+# ------------------------------------------------------------------
+# Published-results snapshot (student portal)
+# One immutable JSON payload per (published exam, PRN): answer sheet +
+# question review. Built on publish and rebuilt right after edits
+# (_refresh_published_derived); while it is stale student reads use the
+# live queries, they never rebuild it themselves.
+# ------------------------------------------------------------------
+_SNAPSHOT_INSERT_CHUNK = 500
+
+
+def _normalize_answer_row(r: dict) -> dict:
+    if not r.get("student_answer"):
+        r["student_answer"] = "(blank)"
+    if r.get("key_answer"):
+        r["key_answer"] = str(r["key_answer"]).strip().upper()
+    if r.get("correct_option"):
+        r["correct_option"] = str(r["correct_option"]).strip().upper()
+    return r
+
+
+def build_published_snapshot(exam_id: int) -> int | None:
+    """
+    (Re)build the student snapshot of one exam. Returns students written,
+    or None if another rebuild of the same exam held the lock too long.
+    Admin side only (publish / edits).
+    """
+    conn = get_connection()
+    try:
+        with _advisory_lock(conn, f"omr_exam_snapshot_{int(exam_id)}", 30) as locked:
+            if not locked:
+                return None
+            return _build_published_snapshot(conn, exam_id)
+    finally:
+        conn.close()
+
+
+def _build_published_snapshot(conn, exam_id: int) -> int:
+    """build_published_snapshot body, on a connection already holding the lock."""
+    try:
+        cur = conn.cursor(dictionary=True)
+
+        cur.execute("SELECT subject_id FROM exams WHERE id=%s", (exam_id,))
+        ex = cur.fetchone()
+        if not ex:
+            return 0
+        subject_id = int(ex["subject_id"])
+
+        qp = load_latest_question_paper(subject_id)
+        qp_id = int(qp["id"]) if qp else None
+
+        # latest attempt per PRN
+        cur.execute(
+            """
+            SELECT es.id AS exam_student_id, es.prn, es.image_path, es.score, es.total_questions
+            FROM exam_students es
+            JOIN (
+                SELECT prn, MAX(id) AS id
+                FROM exam_students
+                WHERE exam_id=%s
+                GROUP BY prn
+            ) latest ON latest.id = es.id
+            """,
+            (exam_id,),
+        )
+        payloads = {}
+        for r in cur.fetchall() or []:
+            payloads[int(r["exam_student_id"])] = {
+                "prn": r["prn"],
+                "sheet": {
+                    "exam_student_id": int(r["exam_student_id"]),
+                    "image_path": r.get("image_path"),
+                    "score": int(r.get("score") or 0),
+                    "total_questions": int(r.get("total_questions") or 0),
+                    "answers": [],
+                },
+                "review": [],
+            }
+
+        # all answers (+ MCQ text) of those attempts in one query
+        cur.execute(
+            """
+            SELECT
+                ea.exam_student_id,
+                ea.question_no,
+
+                mb.question_text,
+                mb.option_a, mb.option_b, mb.option_c, mb.option_d,
+                mb.correct_option,
+                mb.why_correct, mb.why_a_wrong, mb.why_b_wrong, mb.why_c_wrong, mb.why_d_wrong,
+
+                ea.student_answer,
+                ea.key_answer,
+                ea.is_correct,
+                ea.is_blank
+            FROM exam_answers ea
+            JOIN exam_students es ON es.id = ea.exam_student_id
+            LEFT JOIN mcq_bank mb
+              ON mb.question_paper_id = %s
+             AND mb.question_no = ea.question_no
+            WHERE es.exam_id = %s
+            ORDER BY ea.exam_student_id, ea.question_no
+            """,
+            (qp_id, exam_id),
+        )
+        answer_cols = ("question_no", "student_answer", "key_answer", "is_correct", "is_blank")
+        for r in cur.fetchall() or []:
+            p = payloads.get(int(r.pop("exam_student_id")))
+            if p is None:
+                continue  # older duplicate attempt
+            r = _normalize_answer_row(r)
+            p["sheet"]["answers"].append({c: r[c] for c in answer_cols})
+            # without a question paper the review is just the answers
+            p["review"].append(r if qp_id else {c: r[c] for c in answer_cols})
+
+        cur = conn.cursor()
+        conn.start_transaction()
+        cur.execute("DELETE FROM published_snapshots WHERE exam_id=%s", (exam_id,))
+        rows = [
+            (exam_id, p["prn"], json.dumps({"sheet": p["sheet"], "review": p["review"]}, default=str))
+            for p in payloads.values()
+        ]
+        for i in range(0, len(rows), _SNAPSHOT_INSERT_CHUNK):
+            cur.executemany(
+                "INSERT INTO published_snapshots (exam_id, prn, payload) VALUES (%s, %s, %s)",
+                rows[i:i + _SNAPSHOT_INSERT_CHUNK],
+            )
+        cur.execute(
+            """
+            INSERT INTO published_snapshot_state (exam_id, subject_id)
+            VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE built_at = CURRENT_TIMESTAMP
+            """,
+            (exam_id, subject_id),
+        )
+        conn.commit()
+        return len(rows)
+    except Error:
+        conn.rollback()
+        raise
+
+
+def get_published_student_snapshot(prn: str, subject_id: int) -> dict | None:
+    """
+    Student view of a subject from the snapshot (one indexed lookup).
+    Returns None if the subject is not published, else
+      {"exam_id": int, "sheet": {...} | None, "review": [...]}
+    sheet/review have the shapes of get_student_exam_sheet_and_key /
+    get_student_question_review; sheet is None if the PRN has no attempt.
+    """
+    prn = _normalize_prn(prn)
+    if not prn:
+        return None
+
+    def _lookup():
+        conn = get_connection()
+        try:
+            cur = conn.cursor(dictionary=True)
+            cur.execute(
+                """
+                SELECT sp.exam_id,
+                       st.exam_id IS NOT NULL AS built,
+                       ps.payload
+                FROM subject_publish sp
+                LEFT JOIN published_snapshot_state st ON st.exam_id = sp.exam_id
+                LEFT JOIN published_snapshots ps ON ps.exam_id = sp.exam_id AND ps.prn = %s
+                WHERE sp.subject_id = %s AND sp.is_published = 1
+                """,
+                (prn, subject_id),
+            )
+            return cur.fetchone()
+        finally:
+            conn.close()
+
+    row = _lookup()
+    if not row:
+        return None
+
+    exam_id = int(row["exam_id"])
+    if not row["built"]:
+        # edited, admin-side rebuild not done yet -> live queries, read-only
+        return {
+            "exam_id": exam_id,
+            "sheet": get_student_exam_sheet_and_key(prn=prn, exam_id=exam_id),
+            "review": get_student_question_review(prn, subject_id, exam_id=exam_id) or [],
+        }
+
+    if not row["payload"]:
+        return {"exam_id": exam_id, "sheet": None, "review": []}
+
+    payload = json.loads(row["payload"])
+    return {"exam_id": exam_id, "sheet": payload["sheet"], "review": payload["review"]}
+
 
 def get_latest_exam_id_for_subject(subject_id: int) -> int | None:
     conn = get_connection()
     try:
         cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT id
-            FROM exams
-            WHERE subject_id=%s
-            ORDER BY created_at DESC
-            LIMIT 1
-            """,
-            (subject_id,),
-        )
+        cur.execute(_LATEST_EXAM_SQL, (subject_id,))
         row = cur.fetchone()
         return int(row[0]) if row else None
     finally:
@@ -1230,10 +2624,18 @@ def publish_latest_exam_for_subject(subject_id: int, admin_id: int | None = None
             """,
             (subject_id, exam_id, admin_id),
         )
-        return {"ok": True, "subject_id": subject_id, "exam_id": exam_id}
     finally:
         conn.close()
 
+    try:
+        refresh_exam_rank_totals(exam_id)
+        build_published_snapshot(exam_id)
+    except Error as e:
+        # not fatal: student reads fall back to live queries until rebuilt
+        print("DB publish derived data error:", e)
+
+    return {"ok": True, "subject_id": subject_id, "exam_id": exam_id}
+
 
 def unpublish_subject(subject_id: int) -> bool:
     """
@@ -1246,7 +2648,17 @@ def unpublish_subject(subject_id: int) -> bool:
             "UPDATE subject_publish SET is_published=0 WHERE subject_id=%s",
             (subject_id,),
         )
-        return cur.rowcount > 0
+        changed = cur.rowcount > 0
+        cur.execute(
+            """
+            DELETE ps FROM published_snapshots ps
+            JOIN exams e ON e.id = ps.exam_id
+            WHERE e.subject_id = %s
+            """,
+            (subject_id,),
+        )
+        _invalidate_exam_derived(cur, subject_id=subject_id)
+        return changed
     finally:
         conn.close()
 
@@ -1289,6 +2701,15 @@ def get_published_exam_id(subject_id: int) -> int | None:
     finally:
         conn.close()
 
+_EXAM_SHEET_ROW_SQL = """
+    SELECT id AS exam_student_id, image_path, score, total_questions
+    FROM exam_students
+    WHERE exam_id=%s AND prn=%s
+    ORDER BY id DESC
+    LIMIT 1
+"""
+
+
 def get_student_exam_sheet_and_key(*, prn: str, exam_id: int) -> dict | None:
     """
     For a PUBLISHED exam:
@@ -1312,16 +2733,7 @@ def get_student_exam_sheet_and_key(*, prn: str, exam_id: int) -> dict | None:
         cur = conn.cursor(dictionary=True)
 
         # get student's exam row (latest if duplicates)
-        cur.execute(
-            """
-            SELECT id AS exam_student_id, image_path, score, total_questions
-            FROM exam_students
-            WHERE exam_id=%s AND prn=%s
-            ORDER BY id DESC
-            LIMIT 1
-            """,
-            (exam_id, prn),
-        )
+        cur.execute(_EXAM_SHEET_ROW_SQL, (exam_id, prn))
         es = cur.fetchone()
         if not es:
             return None
@@ -1453,6 +2865,12 @@ def save_mcq_bank_items(question_paper_id: int, items: list[dict]) -> int:
         # If you re-upload / re-run LLM for same question_paper_id, clear previous rows
         cur.execute("DELETE FROM mcq_bank WHERE question_paper_id=%s", (question_paper_id,))
 
+        # question review text changed -> student snapshots of this subject are stale
+        cur.execute("SELECT subject_id FROM question_papers WHERE id=%s", (question_paper_id,))
+        qp_row = cur.fetchone()
+        if qp_row:
+            _invalidate_exam_derived(cur, subject_id=int(qp_row[0]), ranks=False)
+
         cur.executemany(
             """
             INSERT INTO mcq_bank (
@@ -1465,10 +2883,13 @@ def save_mcq_bank_items(question_paper_id: int, items: list[dict]) -> int:
             """,
             rows,
         )
-        return int(cur.rowcount)
+        inserted = int(cur.rowcount)
     finally:
         conn.close()
 
+    _refresh_published_derived()
+    return inserted
+
 
 def load_mcq_bank_for_subject(subject_id: int, *, latest: bool = True):
     """
@@ -1652,7 +3073,9 @@ def upsert_lab_marks(subject_id: int, prn: str, marks, updated_by: int | None =
             """,
             (subject_id, prn, marks_val, updated_by),
         )
+        _invalidate_exam_derived(cursor, subject_id=subject_id, snapshot=False)
         conn.commit()
+        _refresh_published_derived()
         return True
     except Error as e:
         print("DB upsert_lab_marks error:", e)
@@ -1662,6 +3085,59 @@ def upsert_lab_marks(subject_id: int, prn: str, marks, updated_by: int | None =
         conn.close()
 
 
+def _parse_lab_marks(marks):
+    """Blank / unparsable -> None (NULL), else float."""
+    try:
+        if marks is not None and not pd.isna(marks) and str(marks).strip() != "":
+            return float(marks)
+    except Exception:
+        pass
+    return None
+
+
+def bulk_upsert_lab_marks(subject_id: int, marks_by_prn: dict, updated_by: int | None = None) -> dict:
+    """
+    Upsert many students' lab marks for a subject in ONE executemany.
+    marks_by_prn: {prn: marks} (blank marks -> NULL)
+    """
+    rows = []
+    skipped = 0
+    for prn, marks in marks_by_prn.items():
+        prn = _normalize_prn(prn)
+        if not prn:
+            skipped += 1
+            continue
+        rows.append((subject_id, prn, _parse_lab_marks(marks), updated_by))
+
+    if not rows:
+        return {"saved": 0, "skipped": skipped}
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(
+            """
+            INSERT INTO lab_marks (subject_id, prn, marks, updated_by)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                marks = VALUES(marks),
+                updated_by = VALUES(updated_by),
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            rows,
+        )
+        _invalidate_exam_derived(cursor, subject_id=subject_id, snapshot=False)
+        conn.commit()
+        _refresh_published_derived()
+        return {"saved": len(rows), "skipped": skipped}
+    except Error as e:
+        print("DB bulk_upsert_lab_marks error:", e)
+        return {"saved": 0, "skipped": skipped + len(rows), "error": str(e)}
+    finally:
+        cursor.close()
+        conn.close()
+
+
 def import_lab_marks_from_excel(subject_id: int, excel_file, updated_by: int | None = None) -> dict:
     """
     Bulk import lab marks for a subject from uploaded Excel.
@@ -1721,8 +3197,11 @@ def import_lab_marks_from_excel(subject_id: int, excel_file, updated_by: int | N
             """,
             rows,
         )
+        inserted_or_updated = cursor.rowcount
+        _invalidate_exam_derived(cursor, subject_id=subject_id, snapshot=False)
         conn.commit()
-        return {"inserted_or_updated": cursor.rowcount, "skipped": skipped}
+        _refresh_published_derived()
+        return {"inserted_or_updated": inserted_or_updated, "skipped": skipped}
     except Error as e:
         print("DB import_lab_marks_from_excel error:", e)
         return {"inserted_or_updated": 0, "skipped": skipped}
@@ -1755,7 +3234,7 @@ def get_lab_marks_for_subject(subject_id: int, course_id: int | None = None) ->
                 SELECT s.prn, s.name, lm.marks, lm.updated_at
                 FROM students s
                 LEFT JOIN lab_marks lm
-                    ON lm.subject_id = %s AND TRIM(lm.prn) = TRIM(s.prn)
+                    ON lm.subject_id = %s AND lm.prn = s.prn
                 WHERE s.course_id = %s
                 ORDER BY s.prn
                 """,
@@ -1798,6 +3277,20 @@ def get_lab_marks_map(subject_id: int) -> dict[str, float | None]:
         conn.close()
 
 
+# latest exam per subject of one course (rn = 1); MySQL 8 window functions
+_LATEST_EXAMS_CTE = """
+    WITH latest AS (
+        SELECT e.id AS exam_id, e.subject_id,
+               ROW_NUMBER() OVER (
+                   PARTITION BY e.subject_id ORDER BY e.created_at DESC, e.id DESC
+               ) AS rn
+        FROM exams e
+        JOIN subjects s ON s.id = e.subject_id
+        WHERE s.course_id = %s
+    )
+"""
+
+
 def get_course_report(course_id: int, pass_percent: float = 35.0) -> dict:
     """
     Course-wide report across all subjects using:
@@ -1805,6 +3298,9 @@ def get_course_report(course_id: int, pass_percent: float = 35.0) -> dict:
       - latest exam per subject => marks stats
 
     pass_percent: percent threshold to consider pass/fail (default 35%)
+
+    Set-based: a fixed number of grouped / windowed queries, no matter
+    how many subjects the course has.
     """
     conn = get_connection()
     try:
@@ -1840,39 +3336,70 @@ def get_course_report(course_id: int, pass_percent: float = 35.0) -> dict:
         enrolled_prns = {str(r["prn"]).strip(): (r.get("name") or "") for r in enrolled}
         total_enrolled = len(enrolled_prns)
 
-        # subjects for course
+        # every subject + stats of its latest exam (NULL exam_id = no exam yet)
         cur.execute(
-            """
-            SELECT id AS subject_id, name AS subject_name
-            FROM subjects
-            WHERE course_id = %s
-            ORDER BY id
+            _LATEST_EXAMS_CTE
+            + """
+            SELECT s.id AS subject_id, s.name AS subject_name, l.exam_id,
+                   COUNT(DISTINCT es.prn) AS present,
+                   COALESCE(MIN(es.score), 0) AS min_score,
+                   COALESCE(MAX(es.score), 0) AS max_score,
+                   COALESCE(AVG(es.score), 0) AS avg_score,
+                   COALESCE(SUM(
+                       CASE
+                           WHEN es.id IS NULL THEN 0
+                           WHEN (CASE WHEN es.total_questions > 0
+                                      THEN es.score * 100.0 / es.total_questions
+                                      ELSE 0 END) < %s THEN 1
+                           ELSE 0
+                       END
+                   ), 0) AS fail_count
+            FROM subjects s
+            LEFT JOIN latest l ON l.subject_id = s.id AND l.rn = 1
+            LEFT JOIN exam_students es ON es.exam_id = l.exam_id
+            WHERE s.course_id = %s
+            GROUP BY s.id, s.name, l.exam_id
+            ORDER BY s.id
             """,
-            (course_id,),
+            (course_id, pass_percent, course_id),
         )
         subjects = cur.fetchall() or []
 
-        subject_reports = []
-        # overall aggregation across latest exams per subject
-        overall_by_prn = {}  # prn -> {"name":.., "score_sum":.., "total_sum":.., "attempted_subjects":..}
+        # toppers per subject (RANK keeps ties)
+        cur.execute(
+            _LATEST_EXAMS_CTE
+            + """
+            SELECT subject_id, prn, name, score, total_questions
+            FROM (
+                SELECT l.subject_id, es.id, es.prn, es.name, es.score, es.total_questions,
+                       RANK() OVER (PARTITION BY l.subject_id ORDER BY es.score DESC) AS rnk
+                FROM latest l
+                JOIN exam_students es ON es.exam_id = l.exam_id
+                WHERE l.rn = 1
+            ) t
+            WHERE rnk = 1
+            ORDER BY subject_id, id
+            """,
+            (course_id,),
+        )
+        toppers_by_subject = {}
+        for r in cur.fetchall() or []:
+            prn = str(r["prn"]).strip()
+            score = int(r.get("score") or 0)
+            total_q = int(r.get("total_questions") or 0)
+            toppers_by_subject.setdefault(int(r["subject_id"]), []).append({
+                "prn": prn,
+                "name": (r.get("name") or enrolled_prns.get(prn) or "").strip(),
+                "score": score,
+                "percent": (score / total_q * 100.0) if total_q > 0 else 0.0,
+            })
 
+        subject_reports = []
         for s in subjects:
             subject_id = int(s["subject_id"])
             subject_name = s["subject_name"]
 
-            # latest exam for this subject
-            cur.execute(
-                """
-                SELECT id, created_at
-                FROM exams
-                WHERE subject_id = %s
-                ORDER BY created_at DESC
-                LIMIT 1
-                """,
-                (subject_id,),
-            )
-            ex = cur.fetchone()
-            if not ex:
+            if s["exam_id"] is None:
                 subject_reports.append({
                     "subject_id": subject_id,
                     "subject_name": subject_name,
@@ -1881,97 +3408,66 @@ def get_course_report(course_id: int, pass_percent: float = 35.0) -> dict:
                 })
                 continue
 
-            exam_id = int(ex["id"])
-
-            # marks for this exam
-            cur.execute(
-                """
-                SELECT prn, name, score, total_questions
-                FROM exam_students
-                WHERE exam_id = %s
-                """,
-                (exam_id,),
-            )
-            rows = cur.fetchall() or []
-
-            present_prns = set()
-            scores = []
-            topper_score = None
-            toppers = []
-            fail_count = 0
-
-            for r in rows:
-                prn = str(r["prn"]).strip()
-                name = (r.get("name") or enrolled_prns.get(prn) or "").strip()
-                score = int(r.get("score") or 0)
-                total_q = int(r.get("total_questions") or 0)
-
-                present_prns.add(prn)
-                scores.append(score)
-
-                pct = (score / total_q * 100.0) if total_q > 0 else 0.0
-                if pct < pass_percent:
-                    fail_count += 1
-
-                # top
-                if topper_score is None or score > topper_score:
-                    topper_score = score
-                    toppers = [{"prn": prn, "name": name, "score": score, "percent": pct}]
-                elif score == topper_score:
-                    toppers.append({"prn": prn, "name": name, "score": score, "percent": pct})
-
-                # overall aggregation
-                if prn not in overall_by_prn:
-                    overall_by_prn[prn] = {
-                        "prn": prn,
-                        "name": name or enrolled_prns.get(prn, ""),
-                        "score_sum": 0,
-                        "total_sum": 0,
-                        "attempted_subjects": 0,
-                    }
-                overall_by_prn[prn]["score_sum"] += score
-                overall_by_prn[prn]["total_sum"] += total_q
-                overall_by_prn[prn]["attempted_subjects"] += 1
-
-            present_count = len(present_prns)
+            present_count = int(s["present"] or 0)
             absent_count = max(0, total_enrolled - present_count)
-
-            if scores:
-                avg_score = sum(scores) / len(scores)
-                min_score = min(scores)
-                max_score = max(scores)
-            else:
-                avg_score = 0.0
-                min_score = 0
-                max_score = 0
-
+            fail_count = int(s["fail_count"] or 0)
             fail_rate = (fail_count / present_count * 100.0) if present_count > 0 else 0.0
 
             subject_reports.append({
                 "subject_id": subject_id,
                 "subject_name": subject_name,
                 "has_exam": True,
-                "latest_exam_id": exam_id,
+                "latest_exam_id": int(s["exam_id"]),
                 "enrolled": total_enrolled,
                 "present": present_count,
                 "absent": absent_count,
-                "min": min_score,
-                "max": max_score,
-                "avg": round(avg_score, 2),
-                "toppers": toppers,          # list (handles ties)
+                "min": int(s["min_score"]),
+                "max": int(s["max_score"]),
+                "avg": round(float(s["avg_score"]), 2),
+                "toppers": toppers_by_subject.get(subject_id, []),   # list (handles ties)
                 "fail_count": fail_count,
                 "fail_rate_percent": round(fail_rate, 2),
                 "pass_percent_threshold": pass_percent,
             })
 
         # Overall toppers (based on sum across latest exams of subjects attempted)
-        overall_list = list(overall_by_prn.values())
-        for r in overall_list:
-            total_sum = r["total_sum"]
-            r["overall_percent"] = round((r["score_sum"] / total_sum * 100.0), 2) if total_sum > 0 else 0.0
-
-        overall_list.sort(key=lambda x: (x["score_sum"], x["overall_percent"]), reverse=True)
-        overall_top = overall_list[:10]  # top 10
+        cur.execute(
+            _LATEST_EXAMS_CTE
+            + """
+            SELECT prn, name, score_sum, total_sum, attempted_subjects
+            FROM (
+                SELECT es.prn,
+                       FIRST_VALUE(es.name) OVER w AS name,
+                       SUM(es.score) OVER p AS score_sum,
+                       SUM(es.total_questions) OVER p AS total_sum,
+                       COUNT(*) OVER p AS attempted_subjects,
+                       ROW_NUMBER() OVER w AS rn
+                FROM latest l
+                JOIN exam_students es ON es.exam_id = l.exam_id
+                WHERE l.rn = 1
+                WINDOW p AS (PARTITION BY es.prn),
+                       w AS (PARTITION BY es.prn ORDER BY l.subject_id, es.id)
+            ) t
+            WHERE rn = 1
+            ORDER BY score_sum DESC,
+                     CASE WHEN total_sum > 0 THEN score_sum / total_sum ELSE 0 END DESC
+            LIMIT 10
+            """,
+            (course_id,),
+        )
+        overall_top = []
+        for r in cur.fetchall() or []:
+            prn = r["prn"]
+            score_sum = int(r["score_sum"] or 0)
+            total_sum = int(r["total_sum"] or 0)
+            overall_top.append({
+                "prn": prn,
+                "name": (r.get("name") or "").strip() or enrolled_prns.get(prn, ""),
+                "score_sum": score_sum,
+                "total_sum": total_sum,
+                "attempted_subjects": int(r["attempted_subjects"]),
+                "overall_percent": round((score_sum / total_sum * 100.0), 2) if total_sum > 0 else 0.0,
+            })
 
         # hardest subjects (highest fail rate)
         hardest = [x for x in subject_reports if x.get("has_exam")]
@@ -2002,6 +3498,8 @@ def get_student_wise_report(
 ) -> dict:
     """
     Student report across all subjects in a course.
+    Fixed number of queries (student + one windowed/grouped query for all
+    subjects), so it is cheap enough to run for a whole cohort.
 
     LAB logic:
     - If NO lab rows exist at all for that subject => Lab="NA"
@@ -2037,15 +3535,46 @@ def get_student_wise_report(
         if not student:
             return {"error": f"Student not found in course. PRN={prn}, course_id={course_id}"}
 
-        # subjects in course
+        # every subject of the course in ONE query:
+        #   latest exam, class stats, my latest score, rank, lab NA/AB/marks
         cur.execute(
-            """
-            SELECT id AS subject_id, name AS subject_name
-            FROM subjects
-            WHERE course_id=%s
-            ORDER BY id
+            _LATEST_EXAMS_CTE
+            + """
+            , me AS (
+                SELECT es.exam_id, es.score,
+                       ROW_NUMBER() OVER (PARTITION BY es.exam_id ORDER BY es.id DESC) AS rn
+                FROM exam_students es
+                JOIN latest l ON l.exam_id = es.exam_id AND l.rn = 1
+                WHERE es.prn = %s
+            ),
+            labs AS (
+                SELECT lm.subject_id,
+                       MAX(CASE WHEN lm.prn = %s THEN lm.marks END) AS my_marks
+                FROM lab_marks lm
+                JOIN subjects s ON s.id = lm.subject_id
+                WHERE s.course_id = %s
+                GROUP BY lm.subject_id
+            )
+            SELECT s.id AS subject_id, s.name AS subject_name,
+                   l.exam_id,
+                   me.score AS my_score,
+                   COUNT(es.id) AS class_count,
+                   AVG(es.score) AS class_avg,
+                   MIN(es.score) AS class_min,
+                   MAX(es.score) AS class_max,
+                   SUM(es.score > COALESCE(me.score, 0)) AS higher,
+                   labs.subject_id IS NOT NULL AS lab_applicable,
+                   labs.my_marks
+            FROM subjects s
+            LEFT JOIN latest l ON l.subject_id = s.id AND l.rn = 1
+            LEFT JOIN me ON me.exam_id = l.exam_id AND me.rn = 1
+            LEFT JOIN exam_students es ON es.exam_id = l.exam_id
+            LEFT JOIN labs ON labs.subject_id = s.id
+            WHERE s.course_id = %s
+            GROUP BY s.id, s.name, l.exam_id, me.score, labs.subject_id, labs.my_marks
+            ORDER BY s.id
             """,
-            (course_id,),
+            (course_id, prn, prn, course_id, course_id),
         )
         subjects = cur.fetchall() or []
 
@@ -2066,63 +3595,24 @@ def get_student_wise_report(
             # -----------------------
             # THEORY: latest exam?
             # -----------------------
-            cur.execute(
-                """
-                SELECT id
-                FROM exams
-                WHERE subject_id=%s
-                ORDER BY created_at DESC
-                LIMIT 1
-                """,
-                (subject_id,),
-            )
-            ex = cur.fetchone()
-            exam_uploaded = bool(ex)
+            exam_uploaded = s["exam_id"] is not None
 
             theory_mark = None
-            class_scores = []
             rank = None
 
             if exam_uploaded:
-                exam_id = int(ex["id"])
-
-                # all scores for ranking + class stats
-                cur.execute(
-                    """
-                    SELECT prn, score
-                    FROM exam_students
-                    WHERE exam_id=%s
-                    """,
-                    (exam_id,),
-                )
-                all_rows = cur.fetchall() or []
-                for r in all_rows:
-                    class_scores.append(int(r["score"] or 0))
-
                 # student theory score (if absent from exam_students => treat as 0)
-                cur.execute(
-                    """
-                    SELECT score
-                    FROM exam_students
-                    WHERE exam_id=%s AND prn=%s
-                    ORDER BY id DESC
-                    LIMIT 1
-                    """,
-                    (exam_id, prn),
-                )
-                me = cur.fetchone()
-                theory_mark = int(me["score"]) if me else 0
+                theory_mark = int(s["my_score"]) if s["my_score"] is not None else 0
 
-                # rank (1 = highest). If tie: same rank style by counting > score.
-                if class_scores:
-                    higher = sum(1 for x in class_scores if x > theory_mark)
-                    rank = higher + 1
+                # rank (1 = highest). If tie: same rank (RANK() style: 1 + #higher)
+                if s["class_count"]:
+                    rank = int(s["higher"] or 0) + 1
 
             # class stats
-            if class_scores:
-                class_avg = round(sum(class_scores) / len(class_scores), 2)
-                class_min = min(class_scores)
-                class_max = max(class_scores)
+            if s["class_count"]:
+                class_avg = round(float(s["class_avg"]), 2)
+                class_min = int(s["class_min"])
+                class_max = int(s["class_max"])
             else:
                 class_avg, class_min, class_max = 0.0, 0, 0
 
@@ -2130,35 +3620,16 @@ def get_student_wise_report(
             # LAB: NA / AB / numeric
             # -----------------------
             # lab_applicable = any row exists for this subject in lab_marks
-            cur.execute(
-                """
-                SELECT 1
-                FROM lab_marks
-                WHERE subject_id=%s
-                LIMIT 1
-                """,
-                (subject_id,),
-            )
-            lab_applicable = cur.fetchone() is not None
+            lab_applicable = bool(s["lab_applicable"])
 
             lab_mark_display = "NA"
             lab_mark_numeric = 0.0
 
             if lab_applicable:
-                cur.execute(
-                    """
-                    SELECT marks
-                    FROM lab_marks
-                    WHERE subject_id=%s AND prn=%s
-                    LIMIT 1
-                    """,
-                    (subject_id, prn),
-                )
-                lm = cur.fetchone()
-                if not lm or lm["marks"] is None:
+                if s["my_marks"] is None:
                     lab_mark_display = "AB"
                 else:
-                    lab_mark_numeric = float(lm["marks"])
+                    lab_mark_numeric = float(s["my_marks"])
                     lab_mark_display = round(lab_mark_numeric, 2)
 
             # -----------------------
@@ -2251,6 +3722,108 @@ def get_student_wise_report(
         return {"error": f"DB error: {e}"}
     finally:
         conn.close()
+
+
+def get_course_cohort_data(course_id: int) -> dict:
+    """
+    Per-subject data for the cohort export (see cohort_report.py), sized by
+    subjects and distinct scores rather than by students:
+      subjects:     [{subject_id, subject_name, exam_id (None = no exam), has_lab}]
+      score_counts: [{subject_id, score, n}]  (latest exams, NULL score = 0)
+    Students come a page at a time from get_course_cohort_chunk.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+
+        cur.execute(
+            _LATEST_EXAMS_CTE
+            + """
+            SELECT s.id AS subject_id, s.name AS subject_name, l.exam_id,
+                   EXISTS (SELECT 1 FROM lab_marks lm WHERE lm.subject_id = s.id) AS has_lab
+            FROM subjects s
+            LEFT JOIN latest l ON l.subject_id = s.id AND l.rn = 1
+            WHERE s.course_id = %s
+            ORDER BY s.id
+            """,
+            (course_id, course_id),
+        )
+        subjects = cur.fetchall() or []
+
+        cur.execute(
+            _LATEST_EXAMS_CTE
+            + """
+            SELECT l.subject_id, COALESCE(es.score, 0) AS score, COUNT(*) AS n
+            FROM latest l
+            JOIN exam_students es ON es.exam_id = l.exam_id
+            WHERE l.rn = 1
+            GROUP BY l.subject_id, COALESCE(es.score, 0)
+            """,
+            (course_id,),
+        )
+        score_counts = cur.fetchall() or []
+
+        return {"subjects": subjects, "score_counts": score_counts}
+    finally:
+        conn.close()
+
+
+def get_course_cohort_chunk(course_id: int, after_prn: str, limit: int) -> dict:
+    """
+    The next `limit` students of a course after `after_prn` (keyset paging on
+    students(course_id, prn)), with their latest-exam scores and lab marks:
+      students: [{prn, name}]
+      scores:   [{subject_id, exam_student_id, prn, score}]
+      labs:     [{subject_id, prn, marks}]
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+
+        cur.execute(
+            """
+            SELECT prn, name FROM students
+            WHERE course_id=%s AND prn > %s
+            ORDER BY prn
+            LIMIT %s
+            """,
+            (course_id, after_prn or "", int(limit)),
+        )
+        students = cur.fetchall() or []
+        if not students:
+            return {"students": [], "scores": [], "labs": []}
+
+        prns = [r["prn"] for r in students]
+        placeholders = ", ".join(["%s"] * len(prns))
+
+        cur.execute(
+            _LATEST_EXAMS_CTE
+            + f"""
+            SELECT l.subject_id, es.id AS exam_student_id, es.prn, es.score
+            FROM latest l
+            JOIN exam_students es ON es.exam_id = l.exam_id
+            WHERE l.rn = 1 AND es.prn IN ({placeholders})
+            """,
+            (course_id, *prns),
+        )
+        scores = cur.fetchall() or []
+
+        cur.execute(
+            f"""
+            SELECT lm.subject_id, lm.prn, lm.marks
+            FROM lab_marks lm
+            JOIN subjects s ON s.id = lm.subject_id
+            WHERE s.course_id = %s AND lm.prn IN ({placeholders})
+            """,
+            (course_id, *prns),
+        )
+        labs = cur.fetchall() or []
+
+        return {"students": students, "scores": scores, "labs": labs}
+    finally:
+        conn.close()
+
+
 def get_student_report_published_only(
     *,
     prn: str,
@@ -2273,85 +3846,58 @@ def get_student_report_published_only(
     try:
         cur = conn.cursor(dictionary=True)
 
-        # 1) subjects for course
+        # published subjects + my exam row + my lab + precomputed class rank/avg
+        # (exam_rank_totals / exam_rank_summary) in ONE query
         cur.execute(
             """
-            SELECT id AS subject_id, name AS subject_name
-            FROM subjects
-            WHERE course_id=%s
-            ORDER BY id
+            SELECT s.id AS subject_id, s.name AS subject_name, sp.exam_id,
+                   me.score, me.total_questions,
+                   lm.marks AS lab_marks,
+                   rs.exam_id IS NOT NULL AS ranks_fresh,
+                   rs.class_size, rs.class_avg_total,
+                   rt.rank_total
+            FROM subjects s
+            JOIN subject_publish sp ON sp.subject_id = s.id AND sp.is_published = 1
+            LEFT JOIN exam_students me ON me.id = (
+                SELECT MAX(x.id) FROM exam_students x
+                WHERE x.exam_id = sp.exam_id AND x.prn = %s
+            )
+            LEFT JOIN lab_marks lm ON lm.subject_id = s.id AND lm.prn = %s
+            LEFT JOIN exam_rank_summary rs
+                ON rs.exam_id = sp.exam_id AND rs.theory_max = %s
+            LEFT JOIN exam_rank_totals rt
+                ON rt.exam_id = sp.exam_id AND rt.theory_max = %s AND rt.prn = %s
+            WHERE s.course_id = %s
+            ORDER BY s.id
             """,
-            (course_id,),
+            (prn, prn, theory_max, theory_max, prn, course_id),
         )
-        all_subjects = cur.fetchall() or []
-
-        # 2) keep ONLY published
-        published_subjects = []
-        for s in all_subjects:
-            sid = int(s["subject_id"])
-            if is_subject_published(sid):
-                published_subjects.append(s)
+        published_subjects = cur.fetchall() or []
 
         if not published_subjects:
             return {"rows": [], "summary": {"message": "No published subjects yet."}}
 
-        rows_out = []
+        # stale (edited, admin-side rebuild not done yet) -> compute live, read-only
+        for r in published_subjects:
+            if not r["ranks_fresh"]:
+                r.update(_live_exam_rank(cur, int(r["exam_id"]), prn, theory_max))
 
-        # helper: lab marks for this student across subjects
-        cur.execute(
-            """
-            SELECT subject_id, marks
-            FROM lab_marks
-            WHERE prn=%s
-            """,
-            (prn,),
-        )
-        lab_map = {int(r["subject_id"]): r["marks"] for r in (cur.fetchall() or [])}
+        rows_out = []
 
         for s in published_subjects:
             subject_id = int(s["subject_id"])
             subject_name = s["subject_name"]
 
-            exam_id = get_published_exam_id(subject_id)
-            if not exam_id:
-                # published subject but exam_id missing → treat as not available
-                rows_out.append(
-                    {
-                        "subject_id": subject_id,
-                        "subject_name": subject_name,
-                        "theory_marks": None,
-                        "lab_marks": lab_map.get(subject_id, None),
-                        "total": None,
-                        "status": "Not available",
-                        "class_avg_total": None,
-                        "rank_total": None,
-                        "class_size": None,
-                    }
-                )
-                continue
-
             # ---- student exam record (theory raw score + total_questions) ----
-            cur.execute(
-                """
-                SELECT id AS exam_student_id, score, total_questions
-                FROM exam_students
-                WHERE exam_id=%s AND prn=%s
-                ORDER BY id DESC
-                LIMIT 1
-                """,
-                (exam_id, prn),
-            )
-            es = cur.fetchone()
-
-            if not es:
+            if s["score"] is None:
                 # absent in theory exam
                 theory_marks = None
             else:
-                score = float(es.get("score") or 0)
-                total_q = float(es.get("total_questions") or 0)
+                score = float(s["score"] or 0)
+                total_q = float(s["total_questions"] or 0)
                 theory_marks = round((score / total_q) * theory_max, 2) if total_q > 0 else 0.0
 
-            lab_marks = lab_map.get(subject_id, None)
+            lab_marks = s["lab_marks"]
             lab_marks = float(lab_marks) if lab_marks is not None else None
 
             # total only if at least something exists
@@ -2364,56 +3910,11 @@ def get_student_report_published_only(
             if total is not None:
                 status = "PASS" if total >= pass_total_min else "FAIL"
 
-            # ---- class average + rank (based on TOTAL = theory_scaled + lab) ----
-            # get all students totals for this subject (for published exam)
-            cur.execute(
-                """
-                SELECT prn, score, total_questions
-                FROM exam_students
-                WHERE exam_id=%s
-                """,
-                (exam_id,),
-            )
-            class_exam = cur.fetchall() or []
-
-            # lab marks for all students in this subject
-            cur.execute(
-                """
-                SELECT prn, marks
-                FROM lab_marks
-                WHERE subject_id=%s
-                """,
-                (subject_id,),
-            )
-            class_lab = { _normalize_prn(r["prn"]): r["marks"] for r in (cur.fetchall() or [])}
-
-            totals = []  # list of (prn, total)
-            for r in class_exam:
-                p = _normalize_prn(r["prn"])
-                score = float(r.get("score") or 0)
-                tq = float(r.get("total_questions") or 0)
-                th = round((score / tq) * theory_max, 2) if tq > 0 else 0.0
-                lb = class_lab.get(p, None)
-                lb = float(lb) if lb is not None else 0.0
-                totals.append((p, round(th + lb, 2)))
-
-            # if exam exists but totals empty
-            if totals:
-                class_size = len(totals)
-                avg_total = round(sum(t for _, t in totals) / class_size, 2)
-
-                # rank: higher total = better rank, handle ties (dense rank)
-                totals_sorted = sorted(totals, key=lambda x: x[1], reverse=True)
-                rank = None
-                current_rank = 0
-                last_score = None
-                for idx, (p, t) in enumerate(totals_sorted):
-                    if last_score is None or t != last_score:
-                        current_rank = current_rank + 1
-                        last_score = t
-                    if p == prn:
-                        rank = current_rank
-                        break
+            # ---- class average + dense rank (TOTAL = theory_scaled + lab), precomputed ----
+            if s["class_size"]:
+                class_size = int(s["class_size"])
+                avg_total = float(s["class_avg_total"])
+                rank = int(s["rank_total"]) if s["rank_total"] is not None else None
             else:
                 class_size = None
                 avg_total = None
@@ -2456,3 +3957,16 @@ def get_student_report_published_only(
 
     finally:
         conn.close()
+
+
+if __name__ == "__main__":
+    # python db_utils.py            -> connection handshake vs pool benchmark
+    # python db_utils.py --explain  -> hot queries use their indexes?
+    if "--explain" in sys.argv:
+        init_db()
+        results = check_hot_query_indexes()
+        for label, r in results.items():
+            print(f"{'OK  ' if r['ok'] else 'FAIL'} {label}: keys={r['keys']} (expected {r['expected']})")
+        sys.exit(0 if all(r["ok"] for r in results.values()) else 1)
+
+    bench_connections()
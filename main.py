@@ -1,121 +1,493 @@
 # main.py
 import os
+import sys
 import glob
 import uuid
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import cv2
+import fitz  # PyMuPDF
+import numpy as np
 
-from config import IMAGES_DIR, MODEL_PATH, PDF_DPI
-from modules.pdf_converter import convert_pdf_to_images
+from config import (
+    IMAGES_DIR,
+    MODEL_PATH,
+    PDF_DPI,
+    TABLE_ROWS,
+    TABLE_COLS,
+    OCR_PARALLEL,
+    OCR_WORKERS,
+    PREDICT_BATCH_PAGES,
+    RASTER_MODE,
+    ROI_OVERVIEW_DPI,
+    ROI_PADDING_PT,
+    OCR_RESULT_CONFIG,
+)
 from modules.image_preprocessor import preprocess_image_mem
 from modules.name_prn_extractor import extract_name_prn
 from modules.cell_extractor import extract_cells
 #from modules.answer_predictor import predict_cell
-from modules.answer_predictor import predict_cells_batch
+from classifier_runtime import predict_cells_batch, get_predictor
 from modules.name_prn_extractor import extract_name_prn_from_image
 from utils.prn_utils import normalize_prn
 
 
-def process_pdf(pdf_path):
+def _init_worker():
+    """
+    Process-pool initializer: load the predictor (config.OCR_BACKEND) so
+    the OCR classifier is loaded once per worker, not once per page.
+    """
+    get_predictor()
+
+
+def _render_page(doc, page_num, dpi, clip=None):
+    """Render one page (or a clip rectangle of it) to a BGR array."""
+    pix = doc[page_num - 1].get_pixmap(dpi=dpi, clip=clip, alpha=False)
+
+    # zero-copy view over the pixmap buffer ...
+    rgb = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
+
+    # ... and the one copy we need: RGB -> BGR (what cv2.imread gave us)
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+def _ink_bbox(mask):
+    """Bounding box (x, y, w, h) of non-zero pixels, or None."""
+    points = cv2.findNonZero(mask)
+    return cv2.boundingRect(points) if points is not None else None
+
+
+def _locate_regions(doc, page_num):
+    """
+    Find the answer table and the Name/PRN header on a low-DPI overview.
+    Returns (overview_img, header_rect, table_rect) with rects in PDF points,
+    or (overview_img, None, None) if the table cannot be located.
+    """
+    overview = _render_page(doc, page_num, ROI_OVERVIEW_DPI)
+    gray = cv2.cvtColor(overview, cv2.COLOR_BGR2GRAY)
+    ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+
+    # the 8x5 answer grid is the largest outer contour on the sheet
+    contours, _ = cv2.findContours(ink, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return overview, None, None
+
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    if w * h < 0.10 * gray.shape[0] * gray.shape[1]:
+        return overview, None, None
+
+    # header = whatever ink sits above the table (Name / PRN lines)
+    header_box = _ink_bbox(ink[:y, :]) if y > 0 else None
+    if header_box is None:
+        return overview, None, None
+
+    page_rect = doc[page_num - 1].rect
+    scale = 72.0 / ROI_OVERVIEW_DPI
+    pad = ROI_PADDING_PT
+
+    def to_points(bx, by, bw, bh):
+        rect = fitz.Rect(bx * scale - pad, by * scale - pad,
+                         (bx + bw) * scale + pad, (by + bh) * scale + pad)
+        return rect & page_rect
+
+    return overview, to_points(*header_box), to_points(x, y, w, h)
+
+
+def _rasterise_page(doc, page_num, raster_mode):
+    """
+    Returns (header_img, table_img, ui_img) for one page.
+
+    "full": one full-page render at PDF_DPI, used for everything.
+    "roi":  low-DPI overview (also the UI image) + full-DPI renders of only
+            the header and table clip rectangles. Falls back to "full"
+            when the table cannot be located.
+    """
+    if raster_mode == "roi":
+        overview, header_rect, table_rect = _locate_regions(doc, page_num)
+        if table_rect is not None:
+            header_img = _render_page(doc, page_num, PDF_DPI, clip=header_rect)
+            table_img = _render_page(doc, page_num, PDF_DPI, clip=table_rect)
+            return header_img, table_img, overview
+        print(f"ROI: table not found on page {page_num}, using full page")
+
+    page_img = _render_page(doc, page_num, PDF_DPI)
+    return page_img, page_img, page_img
+
+
+def iter_pdf_pages(pdf_path, page_nums=None, raster_mode=None):
+    """
+    Stream rasterised PDF pages straight from PyMuPDF (no JPEG on disk),
+    one page in memory at a time:
+        (page_num, (header_img, table_img, ui_img), error)
+    A page that fails to render yields (page_num, None, error) and the
+    stream carries on with the next page.
+
+    page_nums: 1-based page numbers to render (default: all pages)
+    """
+    raster_mode = raster_mode or RASTER_MODE
+
+    with fitz.open(pdf_path) as doc:
+        if page_nums is None:
+            page_nums = range(1, doc.page_count + 1)
+
+        for page_num in page_nums:
+            try:
+                images = _rasterise_page(doc, page_num, raster_mode)
+            except Exception as e:
+                yield page_num, None, str(e)
+                continue
+            yield page_num, images, None
+
+
+def _extract_page(page_num, header_img, table_img, ui_img):
+    """
+    Preprocess one rasterised page and cut out its answer cells.
+    header_img / table_img / ui_img are the same array in "full" mode.
+    Returns (page_result_without_answers, {qno: cell_img}).
+    The UI image is JPEG-encoded here but written later by the parent,
+    once the PRN (and so the file name) is known.
+    """
+    # -------------------------------
+    # Preprocess IN MEMORY
+    # -------------------------------
+    header_pre = preprocess_image_mem(header_img)
+    table_pre = header_pre if table_img is header_img else preprocess_image_mem(table_img)
+
+    # -------------------------------
+    # Extract Name & PRN (from image)
+    # -------------------------------
+    name, prn = extract_name_prn_from_image(header_pre)
+
+    # -------------------------------
+    # Extract cells IN MEMORY
+    # -------------------------------
+    cell_images = extract_cells(table_pre)
+
+    # cell_images keys are (row, col) like (1,1), (1,2) ...
+    cell_images_by_qno = {}
+    qno = 1
+    for row in range(1, TABLE_ROWS + 1):
+        for col in range(1, TABLE_COLS + 1):
+            cell_images_by_qno[qno] = cell_images[(row, col)]
+            qno += 1
+
+    # ORIGINAL page image for UI (encoded now so the raw page can be freed)
+    ok, jpg = cv2.imencode(".jpg", ui_img)
+    if not ok:
+        raise ValueError(f"Failed to encode page image: page {page_num}")
+
+    page = {
+        "page": page_num,
+        "name": name,
+        "prn": prn,
+        "answers": {},
+        "image_bytes": jpg.tobytes(),
+    }
+    return page, cell_images_by_qno
+
+
+def page_pixel_hash(header_img, table_img):
+    """SHA-256 of the pixels OCR actually reads (+ OCR_RESULT_CONFIG)."""
+    h = hashlib.sha256(OCR_RESULT_CONFIG.encode("utf-8"))
+    h.update(np.ascontiguousarray(header_img).data)
+    if table_img is not header_img:
+        h.update(np.ascontiguousarray(table_img).data)
+    return h.hexdigest()
+
+
+def _cached_page(page_num, pixel_sha256, cached, ui_img):
+    """Page result rebuilt from the pixel-hash cache (no OCR)."""
+    ok, jpg = cv2.imencode(".jpg", ui_img)
+    if not ok:
+        raise ValueError(f"Failed to encode page image: page {page_num}")
+
+    return {
+        "page": page_num,
+        "name": cached.get("name"),
+        "prn": cached.get("prn"),
+        "answers": dict(cached.get("answers") or {}),
+        "image_bytes": jpg.tobytes(),
+        "pixel_sha256": pixel_sha256,
+        "from_cache": True,
+    }
+
+
+def _classify_pages(pages_cells):
+    """
+    Cross-page batch stage: classify the cells of many pages in ONE
+    predict_cells_batch call and split the answers back out per page.
+
+    pages_cells: list of (page_result, {qno: cell_img})
+    """
+    batch = {}
+    for page, cells in pages_cells:
+        for qno, cell_img in cells.items():
+            batch[(page["page"], qno)] = cell_img
+
+    predicted = predict_cells_batch(batch) if batch else {}
+
+    for page, cells in pages_cells:
+        page["answers"] = {qno: predicted.get((page["page"], qno)) for qno in cells}
+
+
+def _ocr_chunk(chunk):
+    """
+    Pool entry point: rasterise + OCR a chunk of pages, classifying all
+    their cells together. Returns [(result, error), ...] in page order.
+    Errors are returned (not raised) so one bad page never takes down
+    the whole batch.
+    """
+    pdf_path, page_nums, raster_mode, page_cache_lookup = chunk
+    out = {}
+    extracted = []
+
+    for page_num, images, error in iter_pdf_pages(pdf_path, page_nums, raster_mode):
+        if error is not None:
+            out[page_num] = (None, error)
+            continue
+        try:
+            pixel_sha256 = None
+            cached = None
+            if page_cache_lookup is not None:
+                pixel_sha256 = page_pixel_hash(images[0], images[1])
+                try:
+                    cached = page_cache_lookup(pixel_sha256)
+                except Exception as e:
+                    print(f"Page cache lookup failed (page {page_num}): {e}")
+
+            if cached is not None:
+                out[page_num] = (_cached_page(page_num, pixel_sha256, cached, images[2]), None)
+            else:
+                page, cells = _extract_page(page_num, *images)
+                page["pixel_sha256"] = pixel_sha256
+                extracted.append((page, cells))
+        except Exception as e:
+            out[page_num] = (None, str(e))
+        # only the JPEG bytes + cells outlive this loop, not the raw page
+        images = None
+
+    try:
+        _classify_pages(extracted)
+        for page, _ in extracted:
+            out[page["page"]] = (page, None)
+    except Exception:
+        # isolate the failing page: fall back to one batch per page
+        for page, cells in extracted:
+            try:
+                _classify_pages([(page, cells)])
+                out[page["page"]] = (page, None)
+            except Exception as e:
+                out[page["page"]] = (None, str(e))
+
+    return [out[page_num] for page_num in page_nums]
+
+
+def _iter_page_results(pdf_path, page_nums, workers, batch_pages, raster_mode, page_cache_lookup):
+    """Yield (result, error) per page, always in page order."""
+    batch_pages = max(1, int(batch_pages))
+    if workers > 1:
+        # small PDFs: shrink chunks so every worker still gets pages
+        batch_pages = min(batch_pages, -(-len(page_nums) // workers))
+    chunks = [
+        (pdf_path, page_nums[i:i + batch_pages], raster_mode, page_cache_lookup)
+        for i in range(0, len(page_nums), batch_pages)
+    ]
+
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from _ocr_chunk(chunk)
+        return
+
+    # N workers x TF's own thread pool would oversubscribe the CPU
+    for var in ("OMP_NUM_THREADS", "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"):
+        os.environ.setdefault(var, "1")
+
+    # spawn: forking a process that already initialised TensorFlow can deadlock
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)),
+        mp_context=ctx,
+        initializer=_init_worker,
+    ) as pool:
+        # map() preserves input order
+        for chunk_results in pool.map(_ocr_chunk, chunks):
+            yield from chunk_results
+
+
+def _ui_image_path(run_dir, prn, taken):
+    """<PRN>.jpg, or <PRN>_dupN.jpg if that name is already taken in this run."""
+    safe_prn = normalize_prn(prn)
+
+    name = f"{safe_prn}.jpg"
+    counter = 1
+    while name in taken:
+        name = f"{safe_prn}_dup{counter}.jpg"
+        counter += 1
+
+    taken.add(name)
+    return os.path.join(run_dir, name)
+
+
+def _write_bytes(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def process_pdf(
+    pdf_path,
+    parallel=None,
+    workers=None,
+    batch_pages=None,
+    raster_mode=None,
+    done_pages=None,
+    on_page=None,
+    on_progress=None,
+    page_cache_lookup=None,
+):
     """
     Process a single PDF end-to-end and return one result dict per page.
+
+    parallel:    fan pages out over a process pool (default: config.OCR_PARALLEL)
+    workers:     pool size (default: config.OCR_WORKERS, i.e. CPU count)
+    batch_pages: pages whose cells are classified in one model call
+                 (default: config.PREDICT_BATCH_PAGES)
+    raster_mode: "full" or "roi" (default: config.RASTER_MODE)
+
+    Resume / checkpoint hooks:
+    done_pages:  {page_num: result} from an earlier run — these pages are
+                 not OCR'd again, their results are returned as-is
+    on_page:     called with each NEW page result as soon as it is ready
+    on_progress: called as on_progress(pages_processed, total_pages)
+
+    Page cache hook:
+    page_cache_lookup: pixel_sha256 -> {"name", "prn", "answers"} or None.
+                 Pages whose rendered pixels were OCR'd before (in any PDF)
+                 skip OCR. Must be picklable (a module-level function) when
+                 running in parallel. Every result carries "pixel_sha256"
+                 so callers can fill the cache from on_page.
     """
+    if parallel is None:
+        parallel = OCR_PARALLEL
+    workers = (workers or OCR_WORKERS) if parallel else 1
+    batch_pages = batch_pages or PREDICT_BATCH_PAGES
+    raster_mode = raster_mode or RASTER_MODE
+
     results = []
 
     pdf_id = os.path.splitext(os.path.basename(pdf_path))[0]
     run_dir = os.path.join(IMAGES_DIR, f"run_{pdf_id}_{uuid.uuid4().hex[:8]}")
     os.makedirs(run_dir, exist_ok=True)
 
-    # Convert PDF pages → images (disk kept for UI display)
-    image_paths = convert_pdf_to_images(pdf_path, run_dir, PDF_DPI)
+    with fitz.open(pdf_path) as doc:
+        total_pages = doc.page_count
 
-    for page_num, image_path in enumerate(image_paths, start=1):
-        try:
-            # -------------------------------
-            # Load page image (ONCE)
-            # -------------------------------
-            page_img = cv2.imread(image_path)
-            if page_img is None:
-                raise ValueError(f"Failed to load image: {image_path}")
-
-            # -------------------------------
-            # Preprocess IN MEMORY
-            # -------------------------------
-            preprocessed_img = preprocess_image_mem(page_img)
-
-            # -------------------------------
-            # Extract Name & PRN (from image)
-            # -------------------------------
-            name, prn = extract_name_prn_from_image(preprocessed_img)
-            safe_prn = normalize_prn(prn)
-
-            # Rename page image for UI clarity
-            new_image_path = os.path.join(run_dir, f"{safe_prn}.jpg")
-            counter = 1
-            while os.path.exists(new_image_path):
-                new_image_path = os.path.join(run_dir, f"{safe_prn}_dup{counter}.jpg")
-                counter += 1
-
-            os.rename(image_path, new_image_path)
-            image_path = new_image_path
-
-            # -------------------------------
-            # Extract cells IN MEMORY
-            # -------------------------------
-            cell_images = extract_cells(preprocessed_img)
-
-            # -------------------------------
-            # Predict answers (unchanged logic)
-            # -------------------------------
-            #answers = {}
-            #for qno, ((row, col), cell_img) in enumerate(
-            #    sorted(cell_images.items()), start=1
-            #):
-            #    answers[qno] = predict_cell(cell_img)
-
-            # cell_images keys are (row, col) like (1,1), (1,2) ...
-            cell_images_by_qno = {}
-            qno = 1
-            for row in range(1, 9):       # 8 rows
-                for col in range(1, 6):   # 5 cols
-                    cell_images_by_qno[qno] = cell_images[(row, col)]
-                    qno += 1
-
-            answers = predict_cells_batch(cell_images_by_qno)
-
-
-            # -------------------------------
-            # Collect result
-            # -------------------------------
-            results.append(
-                {
-                    "page": page_num,
-                    "name": name,
-                    "prn": prn,
-                    "answers": answers,
-                    "image_path": image_path,  # ORIGINAL page image for UI
-                }
-            )
+    done_pages = done_pages or {}
+    page_nums = [n for n in range(1, total_pages + 1) if n not in done_pages]
+    processed = total_pages - len(page_nums)
+    if on_progress:
+        on_progress(processed, total_pages)
+
+    taken_names = set()
+    page_results = _iter_page_results(
+        pdf_path, page_nums, workers, batch_pages, raster_mode, page_cache_lookup
+    )
+
+    # UI images are written in the background while OCR continues
+    with ThreadPoolExecutor(max_workers=2) as ui_writer:
+        for page_num, (result, error) in zip(page_nums, page_results):
+            processed += 1
+            if error is not None:
+                print(f"ERROR on page {page_num}: {error}")
+                if on_progress:
+                    on_progress(processed, total_pages)
+                continue
+
+            image_path = _ui_image_path(run_dir, result["prn"], taken_names)
+            ui_writer.submit(_write_bytes, image_path, result.pop("image_bytes"))
+            result["image_path"] = image_path  # ORIGINAL page image for UI
+
+            results.append(result)
+            if on_page:
+                on_page(result)
+            if on_progress:
+                on_progress(processed, total_pages)
 
             # Optional logging
             print("\n" + "=" * 60)
             print(f"Page {page_num}")
-            print(f"Name: {name}")
-            print(f"PRN : {prn}")
+            print(f"Name: {result['name']}")
+            print(f"PRN : {result['prn']}")
             print("=" * 60 + "\n")
 
-        except Exception as e:
-            print(f"ERROR on page {page_num}: {e}")
-            continue
+    if done_pages:
+        results.extend(done_pages.values())
+        results.sort(key=lambda r: r["page"])
 
     return results
 
 
+def compare_raster_modes(pdf_path, **kwargs):
+    """
+    Accuracy check: OCR the same PDF in "full" and "roi" mode and report
+    how often the ROI path agrees with the full-page path.
+    """
+    full = {r["page"]: r for r in process_pdf(pdf_path, raster_mode="full", **kwargs)}
+    roi = {r["page"]: r for r in process_pdf(pdf_path, raster_mode="roi", **kwargs)}
+
+    pages = sorted(set(full) | set(roi))
+    prn_same = name_same = answers_same = answers_total = 0
+    mismatches = []
+
+    for page in pages:
+        f, r = full.get(page), roi.get(page)
+        if f is None or r is None:
+            mismatches.append((page, "failed in " + ("full" if f is None else "roi")))
+            continue
+
+        prn_same += int(normalize_prn(f["prn"]) == normalize_prn(r["prn"]))
+        name_same += int((f["name"] or "").strip() == (r["name"] or "").strip())
+
+        for qno, ans in f["answers"].items():
+            answers_total += 1
+            if r["answers"].get(qno) == ans:
+                answers_same += 1
+            else:
+                mismatches.append((page, f"Q{qno}: full={ans!r} roi={r['answers'].get(qno)!r}"))
+
+    report = {
+        "pages": len(pages),
+        "prn_agreement": prn_same / len(pages) if pages else 0.0,
+        "name_agreement": name_same / len(pages) if pages else 0.0,
+        "answer_agreement": answers_same / answers_total if answers_total else 0.0,
+        "mismatches": mismatches,
+    }
+
+    print(f"Pages compared : {report['pages']}")
+    print(f"PRN agreement  : {report['prn_agreement']:.2%}")
+    print(f"Name agreement : {report['name_agreement']:.2%}")
+    print(f"Answer agreement: {report['answer_agreement']:.2%}")
+    for page, msg in mismatches[:20]:
+        print(f"  page {page}: {msg}")
+
+    return report
+
+
 def main():
-    """Standalone CLI entry (optional)."""
+    """Standalone CLI entry (optional).
+
+    python main.py                       -> OCR every PDF in input_pdfs/
+    python main.py --compare-roi a.pdf   -> full-page vs ROI accuracy check
+    """
     if not os.path.exists(MODEL_PATH):
         print(f"ERROR: Model not found at {MODEL_PATH}")
         return
 
+    if len(sys.argv) == 3 and sys.argv[1] == "--compare-roi":
+        compare_raster_modes(sys.argv[2])
+        return
+
     input_dir = "input_pdfs"
     pdf_files = glob.glob(os.path.join(input_dir, "*.pdf"))
 
@@ -0,0 +1,96 @@
+# ml_facade.py
+# Thin lazy facade over the heavy ML subsystems (OCR pipeline: cv2 /
+# TensorFlow / docTR via main.py; LLM question-paper flow). Nothing heavy
+# is imported until a function is actually called, and then only once
+# per process.
+#
+# Startup benchmark (fresh interpreter per module):
+#   python ml_facade.py --bench
+import sys
+import importlib
+import subprocess
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _ocr_pipeline():
+    return importlib.import_module("main")
+
+
+@lru_cache(maxsize=None)
+def _question_paper_llm():
+    return importlib.import_module("modules.question_paper_llm")
+
+
+def process_pdf(*args, **kwargs):
+    """main.process_pdf, imported on first use."""
+    return _ocr_pipeline().process_pdf(*args, **kwargs)
+
+
+def run_question_paper_llm_flow(*args, **kwargs):
+    """modules.question_paper_llm.run_question_paper_llm_flow, imported on first use."""
+    return _question_paper_llm().run_question_paper_llm_flow(*args, **kwargs)
+
+
+# ------------------------------------------------------------------
+# Startup-time benchmark
+# ------------------------------------------------------------------
+# modules the admin portal imports at startup (must stay light)
+PORTAL_MODULES = [
+    "db_utils",
+    "ocr_service",
+    "course_report",
+    "subject_report",
+    "ui_student_editor",
+    "ui_students_management",
+]
+# what used to be imported at startup
+HEAVY_MODULES = ["main", "modules.question_paper_llm"]
+HEAVY_PACKAGES = ["tensorflow", "doctr", "cv2", "llama_cpp"]
+
+_BENCH_SNIPPET = """
+import sys, time
+t = time.perf_counter()
+import {module}
+dt = time.perf_counter() - t
+heavy = [p for p in {heavy!r} if p in sys.modules]
+print(f"{{dt:.3f}}|{{','.join(heavy)}}")
+"""
+
+
+def _time_import(module):
+    """(seconds, heavy packages loaded) for importing one module cold."""
+    proc = subprocess.run(
+        [sys.executable, "-c", _BENCH_SNIPPET.format(module=module, heavy=HEAVY_PACKAGES)],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        err = (proc.stderr.strip().splitlines() or ["import failed"])[-1]
+        return None, err
+    secs, heavy = proc.stdout.strip().splitlines()[-1].split("|")
+    return float(secs), heavy
+
+
+def bench_startup():
+    """Print cold import time for portal modules vs the heavy ML modules."""
+    ok = True
+    for label, modules in (("portal", PORTAL_MODULES), ("heavy", HEAVY_MODULES)):
+        print(f"[{label}]")
+        for module in modules:
+            secs, heavy = _time_import(module)
+            if secs is None:
+                print(f"  {module:<28} FAILED: {heavy}")
+                continue
+            print(f"  {module:<28} {secs:7.3f}s  {('loads: ' + heavy) if heavy else ''}")
+            if label == "portal" and heavy:
+                ok = False
+    if not ok:
+        print("A portal module pulls in heavy ML packages at import time.")
+    return ok
+
+
+if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        sys.exit(0 if bench_startup() else 1)
+    print("usage: python ml_facade.py --bench")
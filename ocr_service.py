@@ -0,0 +1,165 @@
+# ocr_service.py
+# OCR + evaluation flow shared by the admin portal and the background worker
+# (ocr_worker.py): answer-key parsing, checkpointed PDF OCR, scoring, saving.
+# No Streamlit in here.
+import hashlib
+
+import pandas as pd
+
+from config import OCR_RESULT_CONFIG
+from ml_facade import process_pdf  # OCR pipeline loaded on first use
+from utils.prn_utils import normalize_prn
+from db_utils import (
+    save_exam_results,
+    get_ocr_job,
+    start_ocr_job,
+    load_ocr_job_pages,
+    save_ocr_job_page,
+    finish_ocr_job,
+    get_cached_ocr_page,
+    save_cached_ocr_page,
+)
+
+
+def read_answer_key(key_path) -> dict:
+    """
+    Read key Excel: first row headers, then Qno & option.
+    Returns {q_no: option}. Raises ValueError if the sheet has < 2 columns.
+    """
+    df = pd.read_excel(key_path)
+    if df.shape[1] < 2:
+        raise ValueError("Key Excel must have at least two columns (Qno, Option).")
+
+    q_col = df.columns[0]
+    a_col = df.columns[1]
+
+    key_map = {}
+    for _, row in df.iterrows():
+        q_val = row[q_col]
+        opt_val = row[a_col]
+        if pd.isna(q_val):
+            continue
+        try:
+            q_no = int(q_val)
+        except ValueError:
+            continue
+        opt_str = "" if pd.isna(opt_val) else str(opt_val).strip().upper()
+        key_map[q_no] = opt_str
+
+    return key_map
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _on_page_done(pdf_sha256: str, page: dict) -> None:
+    save_ocr_job_page(pdf_sha256, page)
+    if page.get("pixel_sha256") and not page.get("from_cache"):
+        save_cached_ocr_page(page["pixel_sha256"], page)
+
+
+def ocr_pdf_checkpointed(pdf_path: str, on_progress=None) -> list:
+    """
+    Run the OCR pipeline on one PDF. Pages are checkpointed in MySQL
+    (keyed by PDF content hash), so a crash / restart resumes instead of
+    re-scanning everything.
+
+    Dedup: a PDF whose bytes were fully OCR'd before, under the same
+    OCR_RESULT_CONFIG (cache tag, backend, raster mode), returns the stored
+    pages without touching the pipeline (re-upload with a fixed key only
+    re-scores). Pages whose pixels were seen in another PDF skip OCR via
+    the page cache.
+    """
+    pdf_sha256 = file_sha256(pdf_path)
+
+    job = get_ocr_job(pdf_sha256)
+    if job and job["status"] == "done" and job["ocr_config"] == OCR_RESULT_CONFIG:
+        pages = load_ocr_job_pages(pdf_sha256)
+        if on_progress:
+            on_progress(len(pages), int(job["total_pages"] or len(pages)))
+        return [pages[n] for n in sorted(pages)]
+
+    done_pages = start_ocr_job(pdf_sha256, pdf_path, OCR_RESULT_CONFIG)
+
+    page_count = {"total": 0}
+
+    def _on_progress(done, total):
+        page_count["total"] = total
+        if on_progress:
+            on_progress(done, total)
+
+    pages = process_pdf(
+        pdf_path,
+        done_pages=done_pages,
+        on_page=lambda page: _on_page_done(pdf_sha256, page),
+        on_progress=_on_progress,
+        page_cache_lookup=get_cached_ocr_page,
+    )
+    finish_ocr_job(pdf_sha256, page_count["total"])
+    return pages
+
+
+def score_pages(pages: list, key_map: dict) -> dict:
+    """
+    Compare OCR pages with the key.
+    Returns {prn: [attempt, ...]} in the shape save_exam_results expects.
+    """
+    students = {}
+    total_questions = len(key_map)
+
+    for page in pages:
+        name = (page.get("name") or "").strip() or "Unknown"
+        raw_prn = (page.get("prn") or "").strip()
+        prn = normalize_prn(raw_prn)
+        answers = page.get("answers", {})
+        img_path = page.get("image_path")
+
+        details = []
+        score = 0
+
+        for q_no, correct_opt in key_map.items():
+            raw_ans = answers.get(q_no, "")
+            ans_norm = "" if raw_ans is None else str(raw_ans).strip().upper()
+
+            is_blank = ans_norm == ""
+            is_correct = (not is_blank) and (ans_norm == correct_opt)
+
+            if is_correct:
+                score += 1
+
+            details.append(
+                {
+                    "question": q_no,
+                    "student_answer": ans_norm if ans_norm else "(blank)",
+                    "key_answer": correct_opt,
+                    "is_correct": is_correct,
+                    "is_blank": is_blank,
+                }
+            )
+
+        if prn not in students:
+            students[prn] = []
+
+        students[prn].append({
+            "name": name,
+            "prn": prn,
+            "score": score,
+            "total": total_questions,
+            "details": details,
+            "image_path": img_path,
+        })
+
+    return students
+
+
+def run_ocr_job(subject_id: int, pdf_path: str, key_path: str, on_progress=None) -> int:
+    """OCR + score + save one uploaded answer-sheet PDF. Returns the new exam_id."""
+    key_map = read_answer_key(key_path)
+    pages = ocr_pdf_checkpointed(pdf_path, on_progress=on_progress)
+    students = score_pages(pages, key_map)
+    return save_exam_results(subject_id, pdf_path, key_path, students)
@@ -0,0 +1,120 @@
+# ocr_worker.py
+# Background OCR worker: consumes answer-sheet PDFs queued by the admin portal
+# (ocr_queue table) so OCR never runs inside a Streamlit request.
+#
+#   python ocr_worker.py               # config.OCR_QUEUE_CONCURRENCY slots
+#   python ocr_worker.py --workers 3
+import os
+import socket
+import argparse
+import multiprocessing
+import threading
+import time
+import traceback
+import uuid
+
+from config import (
+    OCR_QUEUE_CONCURRENCY,
+    OCR_QUEUE_POLL_SECONDS,
+    OCR_QUEUE_LEASE_SECONDS,
+    OCR_QUEUE_HEARTBEAT_SECONDS,
+)
+from db_utils import (
+    init_db,
+    claim_next_ocr_queue_job,
+    renew_ocr_queue_lease,
+    update_ocr_queue_progress,
+    complete_ocr_queue_job,
+    fail_ocr_queue_job,
+)
+
+
+def _heartbeat(job_id: int, claim_token: str, stop: threading.Event) -> None:
+    """Renew the job lease until stop is set, so no other worker reclaims it."""
+    while not stop.wait(OCR_QUEUE_HEARTBEAT_SECONDS):
+        try:
+            if not renew_ocr_queue_lease(job_id, claim_token, OCR_QUEUE_LEASE_SECONDS):
+                print(f"[ocr job {job_id}] lease lost")
+                return
+        except Exception as e:
+            # keep trying: the lease only lapses after OCR_QUEUE_LEASE_SECONDS
+            print(f"[ocr job {job_id}] lease renewal failed: {e}")
+
+
+def run_queue_job(job: dict, claim_token: str) -> None:
+    """Process one claimed job and record the outcome in ocr_queue."""
+    from ocr_service import run_ocr_job
+
+    job_id = int(job["id"])
+    print(f"[ocr job {job_id}] subject={job['subject_id']} pdf={job['pdf_path']}")
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat, args=(job_id, claim_token, stop), daemon=True
+    )
+    heartbeat.start()
+    try:
+        exam_id = run_ocr_job(
+            int(job["subject_id"]),
+            job["pdf_path"],
+            job["key_path"],
+            on_progress=lambda done, total: update_ocr_queue_progress(
+                job_id, claim_token, done, total
+            ),
+        )
+    except Exception as e:
+        traceback.print_exc()
+        fail_ocr_queue_job(job_id, claim_token, f"{type(e).__name__}: {e}")
+        return
+    finally:
+        stop.set()
+        heartbeat.join()
+
+    if complete_ocr_queue_job(job_id, claim_token, exam_id):
+        print(f"[ocr job {job_id}] done -> exam_id={exam_id}")
+    else:
+        print(f"[ocr job {job_id}] finished after its lease was lost (exam_id={exam_id})")
+
+
+def worker_loop(slot: int) -> None:
+    """One concurrency slot: claim -> process -> repeat, sleeping when idle."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{slot}"
+    print(f"OCR worker slot {slot} started ({worker_id})")
+    while True:
+        claim_token = uuid.uuid4().hex
+        try:
+            job = claim_next_ocr_queue_job(claim_token, worker_id, OCR_QUEUE_LEASE_SECONDS)
+        except Exception as e:
+            print(f"OCR worker slot {slot}: queue poll failed: {e}")
+            job = None
+
+        if job is None:
+            time.sleep(OCR_QUEUE_POLL_SECONDS)
+            continue
+
+        run_queue_job(job, claim_token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background OCR worker")
+    parser.add_argument("--workers", type=int, default=OCR_QUEUE_CONCURRENCY)
+    args = parser.parse_args()
+
+    init_db()
+
+    workers = max(1, args.workers)
+    if workers == 1:
+        worker_loop(1)
+        return
+
+    # one process per slot; each may still use its own page pool (OCR_PARALLEL)
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=worker_loop, args=(slot,)) for slot in range(1, workers + 1)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,10 +8,7 @@ from db_utils import (
     validate_student,
     get_student_profile,
     get_subjects,
-    is_subject_published,
-    get_published_exam_id,
-    get_student_exam_sheet_and_key,   # image + answers table
-    get_student_question_review,      # mcq_bank + exam_answers join
+    get_published_student_snapshot,   # image + answers + review (published snapshot)
     get_student_report_published_only # ✅ report (published only)
 )
 
@@ -352,21 +349,18 @@ def show_student_dashboard():
 
     subject_id = int(subject_options[selected_subject_name])
 
-    if not is_subject_published(subject_id):
+    # one read from the published snapshot (built at publish time)
+    snapshot = get_published_student_snapshot(profile["prn"], subject_id)
+    if snapshot is None:
         st.warning("This subject is not published by admin yet.")
         return
 
-    exam_id = get_published_exam_id(subject_id)
-    if not exam_id:
-        st.warning("Published exam not found. Ask admin to publish again.")
-        return
-
     st.success(f"Published ✅ — {selected_subject_name}")
 
     # --------------------------------------------------------
     # TOP: Image + Answer Key table
     # --------------------------------------------------------
-    data = get_student_exam_sheet_and_key(prn=profile["prn"], exam_id=exam_id)
+    data = snapshot["sheet"]
     if not data:
         st.info("No exam record found for your PRN in the published exam.")
         return
@@ -414,10 +408,7 @@ def show_student_dashboard():
     st.markdown("---")
     st.subheader("📘 Question-wise Review (Options + Explanations)")
 
-    try:
-        review_rows = get_student_question_review(profile["prn"], subject_id, exam_id=exam_id)
-    except TypeError:
-        review_rows = get_student_question_review(profile["prn"], subject_id)
+    review_rows = snapshot["review"]
 
     if not review_rows:
         st.info("Question review not available (MCQ bank not generated or answers missing).")
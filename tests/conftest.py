@@ -0,0 +1,7 @@
+# tests/conftest.py
+# Tests import the top-level modules (config, db_utils, classifier_runtime, ...)
+# the same way the apps do, from the repository root.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,69 @@
+# tests/test_classifier_parity.py
+# Converted classifier backends (TFLite / ONNX) against the hand-labelled
+# fixture cells (fixtures/ocr_cells/labels.csv) and against the .h5 model.
+# Skipped when a backend has not been converted (python classifier_runtime.py
+# --convert tflite|onnx) or its runtime is not installed.
+import os
+
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("numpy")
+
+import classifier_runtime as cr
+from config import (
+    MODEL_PATH,
+    TFLITE_MODEL_PATH,
+    ONNX_MODEL_PATH,
+    OCR_PARITY_MIN_AGREEMENT,
+    OCR_FIXTURE_MIN_ACCURACY,
+)
+
+CONVERTED = {"tflite": TFLITE_MODEL_PATH, "onnx": ONNX_MODEL_PATH}
+
+
+@pytest.fixture(scope="module")
+def fixtures():
+    return cr.load_labelled_fixtures()
+
+
+def _predict(backend, cells):
+    try:
+        return cr.predict_cells_batch(cells, backend=backend)
+    except ImportError as e:
+        pytest.skip(f"{backend} runtime not installed: {e}")
+
+
+def _converted(backend, cells):
+    if not os.path.exists(CONVERTED[backend]):
+        pytest.skip(f"{backend} model not converted ({CONVERTED[backend]})")
+    return _predict(backend, cells)
+
+
+def test_fixture_cells_are_labelled(fixtures):
+    cells, truth = fixtures
+    on_disk = set(cr.load_fixture_cells())
+    assert set(truth) <= on_disk, f"labels.csv lists missing files: {sorted(set(truth) - on_disk)}"
+    # every option plus blank, so a swapped output mapping cannot pass
+    assert {"A", "B", "C", "D", ""} <= {truth[k] for k in cells}
+
+
+@pytest.mark.parametrize("backend", sorted(CONVERTED))
+def test_converted_backend_matches_labels(backend, fixtures):
+    cells, truth = fixtures
+    got = _converted(backend, cells)
+    accuracy = cr.fixture_accuracy(got, truth)
+    wrong = {k: (truth[k], got[k]) for k in cells if (got[k] or "") != truth[k]}
+    assert accuracy >= OCR_FIXTURE_MIN_ACCURACY, f"{accuracy:.2%}; (label, got): {wrong}"
+
+
+@pytest.mark.parametrize("backend", sorted(CONVERTED))
+def test_converted_backend_matches_h5(backend, fixtures):
+    cells, _ = fixtures
+    got = _converted(backend, cells)
+    if not os.path.exists(MODEL_PATH):
+        pytest.skip(f".h5 model missing ({MODEL_PATH})")
+    expected = _predict("keras", cells)
+    mismatches = {k: (expected[k], got[k]) for k in cells if expected[k] != got[k]}
+    agreement = 1 - len(mismatches) / len(cells)
+    assert agreement >= OCR_PARITY_MIN_AGREEMENT, f"{agreement:.2%}; (h5, {backend}): {mismatches}"
@@ -0,0 +1,29 @@
+# tests/test_hot_query_indexes.py
+# EXPLAIN every hot lookup (db_utils._hot_queries, the same SQL the functions
+# run) and check the plan uses the index the migrations add, so a dropped or
+# renamed index fails here. Uses the apps' DB_* environment variables; skipped
+# when MySQL is not reachable.
+import pytest
+
+pytest.importorskip("mysql.connector")
+pytest.importorskip("pandas")  # imported by db_utils
+
+import db_utils
+
+HOT_QUERY_LABELS = [label for label, *_ in db_utils._hot_queries()]
+
+
+@pytest.fixture(scope="module")
+def plans():
+    try:
+        db_utils.get_connection().close()
+    except db_utils.Error as e:
+        pytest.skip(f"MySQL not available: {e}")
+    db_utils.init_db()  # schema + migrations, as the apps do at startup
+    return db_utils.check_hot_query_indexes()
+
+
+@pytest.mark.parametrize("label", HOT_QUERY_LABELS)
+def test_hot_query_uses_its_index(plans, label):
+    plan = plans[label]
+    assert plan["ok"], f"{label}: EXPLAIN used {plan['keys']}, expected {plan['expected']}"
@@ -87,7 +87,7 @@ def render_students_editor(
     subject_id: int,
     subject_result: Dict[str, Any],
     key_map: Dict[int, str],
-    update_exam_student_identity: Callable[[int, str, str], None],
+    update_exam_student_identity: Callable[[int, str, str], str],
     update_exam_student_answers: Callable[[int, int, list], None],
 
     # DB helpers passed from app.py
@@ -201,7 +201,9 @@ def render_students_editor(
         final_prn = str(st.session_state.get(prn_key, "")).strip()
         final_name = str(st.session_state.get(name_key, "")).strip()
         if final_prn and final_name:
-            update_exam_student_identity(exam_student_id, final_prn, final_name)
+            # keep what the DB stored (normalised PRN), not the raw input
+            final_prn = update_exam_student_identity(exam_student_id, final_prn, final_name)
+            st.session_state[prn_key] = final_prn
             _update_session_identity(
                 subject_result=subject_result,
                 old_prn=str(prn),
@@ -226,17 +228,17 @@ def render_students_editor(
     if not st.session_state.get(auto_done_key, False):
         if len(matches) == 1:
             m = matches[0]
-            st.session_state[prn_key] = m["prn"]
-            st.session_state[name_key] = m["name"]
             st.session_state[auto_done_key] = True
 
             # save immediately
-            update_exam_student_identity(exam_student_id, m["prn"], m["name"])
+            stored_prn = update_exam_student_identity(exam_student_id, m["prn"], m["name"])
+            st.session_state[prn_key] = stored_prn
+            st.session_state[name_key] = m["name"]
             _update_session_identity(
                 subject_result=subject_result,
                 old_prn=str(prn),
                 entry_index=attempt_idx,
-                new_prn=m["prn"],
+                new_prn=stored_prn,
                 new_name=m["name"],
             )
             st.rerun()
@@ -353,15 +355,18 @@ def render_students_editor(
     # After submit
     # --------------------
     if submit_identity:
-        update_exam_student_identity(exam_student_id, new_prn.strip(), new_name.strip())
+        stored_prn = update_exam_student_identity(exam_student_id, new_prn.strip(), new_name.strip())
 
         _update_session_identity(
             subject_result=subject_result,
             old_prn=str(prn),
             entry_index=attempt_idx,
-            new_prn=new_prn.strip(),
+            new_prn=stored_prn,
             new_name=new_name.strip(),
         )
+        # widgets re-seed from the stored values on rerun
+        st.session_state.pop(prn_key, None)
+        st.session_state.pop(name_key, None)
 
         st.success("Identity updated.")
         st.rerun()
@@ -1,6 +1,7 @@
 import pandas as pd
 import streamlit as st
 from student_wise_report import render_student_wise_report
+from cohort_report import render_cohort_export
 
 from db_utils import (
     upsert_student,
@@ -181,6 +182,15 @@ def render_students_management(
                 pass_mark=16,
             )
 
+    with st.expander("⬇ Export All Student Reports (course)", expanded=False):
+        render_cohort_export(
+            course_id=course_id,
+            course_name=course_name,
+            theory_max=40,
+            lab_max=40,
+            pass_mark=16,
+        )
+
 
     # ------------------------------------------------------------------
     # 4️⃣ PASSWORD RESET